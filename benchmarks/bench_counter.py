@@ -0,0 +1,170 @@
+"""
+Suite de benchmark y precisión del contador (services/counter_service.py).
+
+Genera placas sintéticas con posiciones conocidas para una matriz de tamaños,
+densidades y grillas de sectores, y mide para process_sample_image,
+imageToBase64 y visualizeQuarter:
+  - throughput (llamadas/s) y latencia p50/p95,
+  - pico de memoria de arrays (tracemalloc),
+  - error de conteo total y por sector frente a las posiciones reales.
+
+Los resultados se guardan como JSON para comparar corridas en el tiempo:
+
+    python benchmarks/bench_counter.py --out bench_counter.json
+    python benchmarks/bench_counter.py --quick
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import make_plate
+from services.counter_service import (
+    process_sample_image, imageToBase64, visualizeQuarter, get_pipeline,
+    _grid_shape, _bin_points
+)
+
+SIZES = [(1600, 1200), (4000, 3000), (8000, 6000)]
+DENSITIES = [50, 300, 1000]
+SECTORS = [1, 4, 9, 25]
+
+QUICK_SIZES = [(1600, 1200)]
+QUICK_DENSITIES = [50, 300]
+QUICK_SECTORS = [1, 9]
+
+
+def measure(fn, repeat):
+    """Ejecuta fn 'repeat' veces; devuelve (métricas de tiempo y memoria, último resultado)."""
+    fn()  # calentamiento: cachés de pipeline, CLAHE y buffers
+    latencies = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        "repeat": repeat,
+        "throughput_per_s": round(len(latencies) / sum(latencies), 2),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "peak_mb": round(peak / 2**20, 2)
+    }, result
+
+
+def count_error(result, positions, sectors, width, height):
+    """Error absoluto y relativo del total, y error absoluto medio por sector."""
+    rows, cols = _grid_shape(sectors)
+    truth = _bin_points(positions, rows, cols, height, width)[:sectors]
+    counted = np.array([s["count"] for s in result["sectors_data"]])
+    total_truth = len(positions)
+    return {
+        "truth": total_truth,
+        "counted": result["total"],
+        "abs_error": abs(result["total"] - total_truth),
+        "rel_error": round(abs(result["total"] - total_truth) / total_truth, 4) if total_truth else 0.0,
+        "sector_mae": round(float(np.mean(np.abs(counted - truth))), 3)
+    }
+
+
+def run(sizes, densities, sectors_list, repeat, render):
+    cases = []
+    for width, height in sizes:
+        for colonies in densities:
+            image_bytes, positions = make_plate(width, height, colonies, seed=colonies)
+            img = get_pipeline().load(image_bytes)
+
+            for sectors in sectors_list:
+                timing, result = measure(
+                    lambda: _uncached_process(image_bytes, sectors, render), repeat
+                )
+                rows, cols = _grid_shape(sectors)
+                counts = [s["count"] for s in result["sectors_data"]]
+                case = {
+                    "width": width,
+                    "height": height,
+                    "colonies": colonies,
+                    "sectors": sectors,
+                    "image_bytes": len(image_bytes),
+                    "process_sample_image": timing,
+                    "accuracy": count_error(result, positions, sectors, width, height),
+                    "visualizeQuarter": measure(lambda: visualizeQuarter(img, (rows, cols), counts), repeat)[0],
+                }
+                if sectors == sectors_list[0]:
+                    case["imageToBase64"] = measure(lambda: imageToBase64(img), repeat)[0]
+                cases.append(case)
+                acc = case["accuracy"]
+                print(
+                    f"{width}x{height} n={colonies:<5} sectors={sectors:<3} "
+                    f"p50={timing['p50_ms']:>8}ms p95={timing['p95_ms']:>8}ms "
+                    f"peak={timing['peak_mb']:>7}MB err={acc['abs_error']} ({acc['rel_error']:.1%})",
+                    file=sys.stderr
+                )
+    return cases
+
+
+def _uncached_process(image_bytes, sectors, render):
+    # Sin vaciar la caché de etapas solo la primera llamada decodificaría
+    get_pipeline().clear_cache()
+    return process_sample_image(image_bytes, sectors=sectors, render=render)
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="Archivo JSON de salida (por defecto stdout).")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--render", default="full", choices=["counts", "overview", "full"])
+    parser.add_argument("--quick", action="store_true", help="Matriz reducida para pruebas rápidas.")
+    args = parser.parse_args()
+
+    if args.quick:
+        sizes, densities, sectors_list = QUICK_SIZES, QUICK_DENSITIES, QUICK_SECTORS
+    else:
+        sizes, densities, sectors_list = SIZES, DENSITIES, SECTORS
+
+    report = {
+        "environment": environment(),
+        "config": {"repeat": args.repeat, "render": args.render},
+        "cases": run(sizes, densities, sectors_list, args.repeat, args.render)
+    }
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark de decodificación de fotos grandes: decodificación completa contra
+decodificación reducida (IMREAD_REDUCED_COLOR_*) en CounterPipeline.load.
+
+Cada modo corre en un proceso nuevo para que el pico de memoria no se mezcle.
+
+    python benchmarks/bench_decode.py [--sizes 12,24,48] [--repeat 5] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_plate
+
+
+def make_jpeg(megapixels, seed=0):
+    """JPEG sintético 4:3 del tamaño pedido."""
+    height = int((megapixels * 1e6 * 3 / 4) ** 0.5)
+    width = int(height * 4 / 3)
+    image_bytes, _ = make_plate(width, height, colonies=500, seed=seed)
+    return image_bytes, (width, height)
+
+
+def _measure(image_bytes, reduced, repeat, queue):
+    from services.counter_service import CounterPipeline
+
+    pipeline = CounterPipeline(reduced_decode=reduced)
+    tracemalloc.start()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img = pipeline.load(image_bytes)
+        latencies.append(time.perf_counter() - start)
+        del img
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put({
+        "p50_ms": round(1000 * statistics.median(latencies), 2),
+        "max_ms": round(1000 * max(latencies), 2),
+        # Los arrays que devuelve OpenCV se reservan con el asignador de NumPy,
+        # así que tracemalloc los contabiliza
+        "peak_mb": round(traced_peak / 2**20, 1)
+    })
+
+
+def run(sizes, repeat):
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for megapixels in sizes:
+        image_bytes, (width, height) = make_jpeg(megapixels)
+        row = {"megapixels": megapixels, "width": width, "height": height, "jpeg_bytes": len(image_bytes)}
+        for mode, reduced in (("full", False), ("reduced", True)):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(image_bytes, reduced, repeat, queue))
+            proc.start()
+            row[mode] = queue.get()
+            proc.join()
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="12,24,48", help="Megapíxeles separados por coma.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="Guardar resultados en JSON.")
+    args = parser.parse_args()
+
+    results = run([float(s) for s in args.sizes.split(",")], args.repeat)
+
+    print(f"{'MP':>5} {'mode':>8} {'p50 ms':>9} {'max ms':>9} {'peak MB':>8}")
+    for row in results:
+        for mode in ("full", "reduced"):
+            m = row[mode]
+            print(f"{row['megapixels']:>5g} {mode:>8} {m['p50_ms']:>9} {m['max_ms']:>9} {m['peak_mb']:>8}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Microbenchmark del costo por request de obtener los clientes de Firebase:
+la implementación anterior (initialize_firebase() en cada get_*) contra el
+registro con clientes cacheados de utils/firebase_config.
+
+Usa una cuenta de servicio generada al vuelo: los clientes se construyen pero
+no se hace ninguna llamada de red.
+
+    python benchmarks/bench_firebase_registry.py [--requests 2000]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin
+from firebase_admin import credentials, firestore, storage, auth
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from utils.firebase_config import get_db, get_bucket, get_auth
+
+
+def fake_service_account():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return {
+        "type": "service_account",
+        "project_id": "cocoa-bench",
+        "private_key_id": "bench",
+        "private_key": pem,
+        "client_email": "bench@cocoa-bench.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token"
+    }
+
+
+def legacy_resources():
+    """Lo que hacía cada get_db/get_bucket/get_auth antes del registro."""
+    return {
+        "db": firestore.client(),
+        "bucket": storage.bucket(),
+        "auth": auth
+    }
+
+
+def legacy_request():
+    # process_sample: get_auth (middleware), get_bucket y get_db
+    legacy_resources()["auth"]
+    legacy_resources()["bucket"]
+    legacy_resources()["db"]
+
+
+def registry_request():
+    get_auth()
+    get_bucket()
+    get_db()
+
+
+def bench(fn, requests):
+    fn()
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return 1e6 * (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    firebase_admin.initialize_app(
+        credentials.Certificate(fake_service_account()), {"storageBucket": "cocoa-bench.appspot.com"}
+    )
+    before = bench(legacy_request, args.requests)
+    after = bench(registry_request, args.requests)
+    print(f"before: {before:9.2f} us/request")
+    print(f"after:  {after:9.2f} us/request  ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
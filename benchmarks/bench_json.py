@@ -0,0 +1,104 @@
+"""
+Benchmark de la serialización JSON (middlewares/json_provider.py) y de la
+compresión de respuestas (middlewares/compression.py).
+
+Para cargas típicas de la API mide el tiempo de codificar con el provider
+por defecto de Flask (json de la stdlib) y con FastJSONProvider (orjson), y
+los bytes enviados sin comprimir, con gzip y con brotli (si está instalado):
+
+  - sample_counts: respuesta de /process con render=counts (coordenadas)
+  - sector_image: recorte de sector en Base64 (/<id>/sectors/<n>/image)
+  - sample_full: resultado del contador con las imágenes en Base64
+  - list: página de 200 muestras de GET /api/samples
+
+    python benchmarks/bench_json.py [--repeat 50] [--out bench_json.json]
+
+Las imágenes en Base64 apenas comprimen (~25%, lo que agrega la Base64) con
+cualquier nivel; los conteos y listados bajan entre 2 y 13 veces.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from benchmarks.synthetic import make_plate
+from benchmarks.bench_reports import make_samples
+from services.counter_service import process_sample_image, render_sector_image
+from middlewares.json_provider import FastJSONProvider
+from middlewares import compression
+
+
+def make_payloads():
+    image_bytes, _ = make_plate(1600, 1200, 300, seed=1)
+    counts = process_sample_image(image_bytes, sectors=4, render="counts")
+    full = process_sample_image(image_bytes, sectors=4, render="full")
+    sample = make_samples(1)[0]
+    return {
+        "sample_counts": {
+            "status": "success",
+            "data": {**sample, "points": [list(p) for p in counts["points"]]}
+        },
+        "sector_image": {"status": "success", "data": render_sector_image(image_bytes, 1, sectors=4)},
+        "sample_full": {"status": "success", "data": {**sample, "results": {k: v for k, v in full.items() if k != "points"}}},
+        "list": {"status": "success", "data": make_samples(200), "meta": {"limit": 200, "next_cursor": None}}
+    }
+
+
+def timed(fn, repeat):
+    """Mediana en milisegundos de repeat llamadas."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(1000 * statistics.median(times), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--out", help="Archivo JSON de salida (por defecto stdout).")
+    args = parser.parse_args()
+
+    stdlib_app = Flask("stdlib")
+    fast_app = Flask("fast")
+    fast_app.json = FastJSONProvider(fast_app)
+
+    results = {}
+    for name, payload in make_payloads().items():
+        with stdlib_app.app_context():
+            stdlib_ms = timed(lambda: stdlib_app.json.response(payload).get_data(), args.repeat)
+        with fast_app.app_context():
+            fast_ms = timed(lambda: fast_app.json.response(payload).get_data(), args.repeat)
+            body = fast_app.json.response(payload).get_data()
+
+        wire = {"identity": len(body)}
+        compress_ms = {}
+        for encoding in ["gzip", "br"] if compression.brotli is not None else ["gzip"]:
+            wire[encoding] = len(compression.compress(body, encoding))
+            compress_ms[encoding] = timed(lambda: compression.compress(body, encoding), max(1, args.repeat // 5))
+
+        results[name] = {
+            "encode_ms": {"stdlib": stdlib_ms, "orjson": fast_ms if fast_app.json.fast else None},
+            "compress_ms": compress_ms,
+            "bytes": wire
+        }
+        sizes = " ".join(f"{k}={v / 1024:.1f}KB" for k, v in wire.items())
+        print(f"{name:<14} stdlib={stdlib_ms:>8}ms orjson={fast_ms:>8}ms {sizes}", file=sys.stderr)
+
+    report = {"repeat": args.repeat, "orjson": fast_app.json.fast, "brotli": compression.brotli is not None, "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
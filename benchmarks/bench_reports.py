@@ -0,0 +1,143 @@
+"""
+Benchmark del reporte mensual (services/report_service.py) frente a la
+implementación anterior (DataFrame + ExcelWriter y un drawString por fila).
+
+Genera muestras sintéticas con la forma de los documentos de Firestore y
+mide tiempo y pico de memoria (tracemalloc) de cada formato:
+
+    python benchmarks/bench_reports.py [--samples 10000] [--out bench_reports.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+from services.export_service import flatten_sample
+from services.report_service import write_excel, write_pdf
+
+MONTH = "2024-05"
+
+
+def make_samples(count, seed=0):
+    """Documentos de muestra sintéticos del mes, ordenados por fecha."""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        sectors = rng.choice([1, 4, 9])
+        counts = [rng.randint(0, 300) for _ in range(sectors)]
+        samples.append({
+            "id": f"sample-{i:06d}",
+            "user_id": "bench-user",
+            "name": f"Muestra {i}",
+            "date": f"{MONTH}-{rng.randint(1, 31):02d}",
+            "time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            "crop_type": rng.choice(["camaron", "tilapia", "default"]),
+            "crop_state": rng.choice(["larva", "postlarva", "default"]),
+            "original_image_url": f"https://storage.example/{i}/original.jpg",
+            "processed_image_url": f"https://storage.example/{i}/processed.png",
+            "results": {
+                "total_colonies": sum(counts),
+                "sectors": [{"id": s + 1, "count": c, "image_url": None} for s, c in enumerate(counts)],
+                "stats": {"mean": sum(counts) / sectors, "max": max(counts), "min": min(counts)},
+                "grid": {"rows": 1, "cols": sectors}
+            },
+            "params": {"sectors": sectors, "sensitivity": 50, "render": "full", "tiled": False},
+            "notes": "",
+            "status": "completado",
+            "created_at": f"{MONTH}-01T00:00:00"
+        })
+    samples.sort(key=lambda s: s["date"])
+    return samples
+
+
+def legacy_excel(samples):
+    data = list(samples)
+    df = pd.DataFrame(data)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Reporte Mensual')
+    return output.getbuffer().nbytes
+
+
+def legacy_pdf(samples):
+    data = list(samples)
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    p.drawString(100, 750, f"Reporte de Larvas - Mes: {MONTH}")
+    y = 700
+    for item in data:
+        p.drawString(100, y, f"Fecha: {item.get('date')} - Muestra: {item.get('name')} - Total: {item.get('results', {}).get('total_colonies')}")
+        y -= 20
+        if y < 50:
+            p.showPage()
+            y = 750
+    p.save()
+    return buffer.getbuffer().nbytes
+
+
+def streaming_excel(samples):
+    output = io.BytesIO()
+    write_excel((flatten_sample(s) for s in samples), output)
+    return output.getbuffer().nbytes
+
+
+def streaming_pdf(samples):
+    output = io.BytesIO()
+    write_pdf((flatten_sample(s) for s in samples), output, MONTH)
+    return output.getbuffer().nbytes
+
+
+def measure(fn, samples):
+    """
+    Tiempo sin trazar (tracemalloc multiplica el costo de las asignaciones) y
+    pico de memoria en una segunda pasada. Las muestras se entregan como
+    iterador, igual que desde el cursor de Firestore; el pico incluye el
+    archivo generado en memoria.
+    """
+    start = time.perf_counter()
+    size = fn(iter(samples))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(iter(samples))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 2), "output_kb": round(size / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--out", help="Archivo JSON de salida (por defecto stdout).")
+    args = parser.parse_args()
+
+    samples = make_samples(args.samples)
+    results = {}
+    for name, fn in [
+        ("legacy_excel", legacy_excel), ("streaming_excel", streaming_excel),
+        ("legacy_pdf", legacy_pdf), ("streaming_pdf", streaming_pdf),
+    ]:
+        results[name] = measure(fn, samples)
+        print(f"{name:<16} {results[name]['seconds']:>8}s peak={results[name]['peak_mb']:>8}MB "
+              f"size={results[name]['output_kb']}KB", file=sys.stderr)
+
+    report = {"samples": args.samples, "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Paridad entre la detección por componentes conexas (CounterPipeline.detect) y
+la implementación anterior con findContours + contourArea + moments, sobre
+las placas sintéticas del benchmark.
+
+Compara totales y conteos por sector y reporta el tiempo de la detección.
+Termina con código 1 si algún caso difiere más allá de la tolerancia.
+
+    python benchmarks/parity_contours.py [--tolerance 0.01] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import make_plate
+from services.counter_service import get_pipeline, _grid_shape, _bin_points
+
+SIZES = [(1600, 1200), (4000, 3000)]
+DENSITIES = [50, 300, 1000]
+SENSITIVITIES = [30, 50, 70]
+SECTORS = [1, 4, 9, 25]
+
+
+def detect_contours(pipeline, blurred, sensitivity):
+    """Detección de referencia: la implementación previa basada en contornos."""
+    thresh = pipeline.binarize(blurred, sensitivity)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    points = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if pipeline.min_area < area < pipeline.max_area:
+            M = cv2.moments(cnt)
+            if M["m00"] != 0:
+                points.append((int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])))
+    return points
+
+
+def timed(fn, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, round(1000 * (time.perf_counter() - start) / repeat, 3)
+
+
+def run(tolerance):
+    pipeline = get_pipeline()
+    cases, failures = [], 0
+    for width, height in SIZES:
+        for colonies in DENSITIES:
+            image_bytes, _ = make_plate(width, height, colonies, seed=colonies)
+            img, blurred = pipeline.prepare(image_bytes)
+            h, w = img.shape[:2]
+            for sensitivity in SENSITIVITIES:
+                legacy, legacy_ms = timed(lambda: detect_contours(pipeline, blurred, sensitivity))
+                current, current_ms = timed(lambda: pipeline.detect(blurred, sensitivity))
+                for sectors in SECTORS:
+                    rows, cols = _grid_shape(sectors)
+                    a = _bin_points(legacy, rows, cols, h, w)[:sectors]
+                    b = _bin_points(current, rows, cols, h, w)[:sectors]
+                    allowed = max(1, int(round(tolerance * len(legacy))))
+                    ok = abs(len(legacy) - len(current)) <= allowed and int(np.max(np.abs(a - b))) <= allowed
+                    failures += not ok
+                    cases.append({
+                        "width": width, "height": height, "colonies": colonies,
+                        "sensitivity": sensitivity, "sectors": sectors,
+                        "contours_total": len(legacy), "components_total": len(current),
+                        "max_sector_diff": int(np.max(np.abs(a - b))),
+                        "contours_ms": legacy_ms, "components_ms": current_ms,
+                        "ok": ok
+                    })
+                print(
+                    f"{width}x{height} n={colonies:<5} s={sensitivity:<3} contours={len(legacy):<5} "
+                    f"components={len(current):<5} {legacy_ms:>8}ms -> {current_ms:>8}ms",
+                    file=sys.stderr
+                )
+    return cases, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Diferencia relativa admitida (mínimo 1 colonia).")
+    parser.add_argument("--json", dest="json_path", help="Guardar resultados en JSON.")
+    args = parser.parse_args()
+
+    cases, failures = run(args.tolerance)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"tolerance": args.tolerance, "cases": cases}, f, indent=2)
+
+    print(f"{len(cases) - failures}/{len(cases)} cases within tolerance", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Generador de placas sintéticas con posiciones de colonias conocidas, para
+medir velocidad y error de conteo del contador.
+"""
+import cv2
+import numpy as np
+
+
+def make_plate(width=1600, height=1200, colonies=300, seed=0, fmt=".jpg", quality=90):
+    """
+    Dibuja 'colonies' puntos oscuros sin solaparse sobre un fondo claro con ruido.
+    El radio escala con el ancho, de modo que tras reducir a 800px las colonias
+    mantienen el tamaño que espera el contador.
+
+    Devuelve (image_bytes, positions) con las posiciones (x, y) en píxeles de la
+    imagen generada.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 200, np.uint8)
+    img += rng.integers(0, 20, img.shape, dtype=np.uint8)
+
+    scale = max(1.0, width / 800)
+    min_r, max_r = 3 * scale, 6 * scale
+    # Grilla de celdas con a lo sumo una colonia por celda para evitar solapes
+    cell = int(np.ceil(2 * max_r + 4 * scale))
+    cells_x, cells_y = width // cell, height // cell
+    total_cells = cells_x * cells_y
+    if colonies > total_cells:
+        raise ValueError(f"At most {total_cells} colonies fit in a {width}x{height} plate")
+
+    positions = []
+    for idx in rng.choice(total_cells, size=colonies, replace=False):
+        cy, cx = divmod(int(idx), cells_x)
+        radius = int(rng.uniform(min_r, max_r))
+        slack = max(0, cell // 2 - radius - 1)
+        x = cx * cell + cell // 2 + int(rng.integers(-slack, slack + 1))
+        y = cy * cell + cell // 2 + int(rng.integers(-slack, slack + 1))
+        cv2.circle(img, (x, y), radius, (30, 30, 30), -1)
+        positions.append((x, y))
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == ".jpg" else []
+    ok, buffer = cv2.imencode(fmt, img, params)
+    return buffer.tobytes(), positions
@@ -0,0 +1,72 @@
+import click
+from utils.firebase_config import get_db, get_bucket
+
+
+def register_commands(app):
+    """Registra los comandos de mantenimiento en el CLI de Flask (flask --app main ...)."""
+
+    @app.cli.command("migrate-sample-images")
+    @click.option("--page-size", default=100, show_default=True, help="Documentos leídos por página.")
+    @click.option("--dry-run", is_flag=True, help="Solo cuenta los documentos a migrar.")
+    def migrate_sample_images_command(page_size, dry_run):
+        """Mueve las imágenes Base64 de los documentos de muestras a Storage."""
+        from services.storage_service import migrate_sample_images
+
+        db = get_db()
+        bucket = get_bucket()
+        if not db or not bucket:
+            raise click.ClickException("Firebase is not available")
+
+        stats = migrate_sample_images(db, bucket, page_size=page_size, dry_run=dry_run)
+        click.echo(
+            f"Scanned {stats['scanned']} samples, migrated {stats['migrated']} "
+            f"({stats['bytes_moved']} base64 bytes), errors: {stats['errors']}"
+        )
+
+    @app.cli.command("rebuild-monthly-aggregates")
+    @click.option("--user", "user_id", default=None, help="Solo las muestras de este usuario.")
+    @click.option("--page-size", default=500, show_default=True, help="Documentos leídos por página.")
+    def rebuild_monthly_aggregates_command(user_id, page_size):
+        """Recalcula los agregados mensuales por usuario desde la colección de muestras."""
+        from services.aggregate_service import rebuild_aggregates
+
+        db = get_db()
+        if not db:
+            raise click.ClickException("Firebase is not available")
+
+        stats = rebuild_aggregates(db, user_id=user_id, page_size=page_size)
+        click.echo(
+            f"Aggregated {stats['samples']} samples into {stats['aggregates']} monthly documents, "
+            f"deleted {stats['deleted']} stale"
+        )
+
+    @app.cli.command("recover-stale-uploads")
+    @click.option("--older-than", default=3600, show_default=True,
+                  help="Segundos sin cambios tras los que una subida en curso se da por perdida.")
+    @click.option("--page-size", default=200, show_default=True, help="Documentos leídos por página.")
+    @click.option("--dry-run", is_flag=True, help="Solo cuenta las muestras a recuperar.")
+    def recover_stale_uploads_command(older_than, page_size, dry_run):
+        """Marca como 'error' las muestras que quedaron en 'subiendo' tras caerse un worker."""
+        from services.upload_service import recover_stale_uploads
+
+        db = get_db()
+        if not db:
+            raise click.ClickException("Firebase is not available")
+
+        stats = recover_stale_uploads(db, stale_after=older_than, page_size=page_size, dry_run=dry_run)
+        click.echo(
+            f"Scanned {stats['scanned']} uploading samples, marked {stats['recovered']} as error, "
+            f"errors: {stats['errors']}"
+        )
+
+    @app.cli.command("massive-worker")
+    @click.option("--once", is_flag=True, help="Termina cuando la cola queda vacía.")
+    @click.option("--poll-interval", default=2.0, show_default=True, help="Segundos entre consultas a la cola vacía.")
+    def massive_worker_command(once, poll_interval):
+        """Procesa las cargas masivas encoladas por /api/tasks/massive."""
+        from services.job_queue import get_job_queue
+        from services.massive_service import MassiveProcessor
+
+        queue = get_job_queue()
+        click.echo(f"Massive worker {queue.worker_id} polling {queue.path}")
+        MassiveProcessor.from_env(queue).run_forever(poll_interval=poll_interval, once=once)
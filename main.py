@@ -10,6 +10,12 @@ def create_app():
     load_dotenv()
     
     app = Flask(__name__)
+
+    # JSON con orjson (si está instalado) y compresión gzip/brotli de las respuestas
+    from middlewares.json_provider import FastJSONProvider
+    from middlewares.compression import init_compression
+    app.json = FastJSONProvider(app)
+    init_compression(app)
     
     # Configuración de seguridad
     app.config["ALLOWED_ORIGINS"] = os.getenv("ALLOWED_ORIGIN", "*")
@@ -33,10 +39,30 @@ def create_app():
     app.register_blueprint(reportsBp, url_prefix='/api/reports')
     app.register_blueprint(usersBp, url_prefix='/api/users')
 
+    # Comandos de mantenimiento (flask --app main <comando>)
+    from commands import register_commands
+    register_commands(app)
+
     @app.route('/health', methods=['GET'])
     def health_check():
         return jsonify({"status": "healthy", "service": "cocoa-api"}), 200
 
+    from middlewares.auth_middleware import metrics_token_required
+
+    @app.route('/metrics', methods=['GET'])
+    @metrics_token_required
+    def metrics():
+        from services.executor_service import get_counter_executor
+        from services.upload_service import get_uploader
+        from middlewares.auth_middleware import token_cache_stats
+        from services.email_service import get_outbox
+        return jsonify({
+            "counter_pool": get_counter_executor().stats(),
+            "sample_uploads": get_uploader().stats(),
+            "auth_token_cache": token_cache_stats(),
+            "email_outbox": get_outbox().stats()
+        }), 200
+
     return app
 
 if __name__ == "__main__":
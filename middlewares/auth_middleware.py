@@ -1,6 +1,22 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
 from functools import wraps
 from flask import request, jsonify, g
 from utils.firebase_config import get_auth
+from utils.cache import LRUCache
+
+# Claims de ID tokens ya verificados, por hash del token y hasta su 'exp'.
+# Los dashboards consultan constantemente con el mismo token.
+token_cache = LRUCache(maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 4096)))
+
+# Token de /metrics (Authorization: Bearer <token>); sin él /metrics no se expone
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Cada cuánto se refrescan en segundo plano las claves públicas de Google
+KEY_REFRESH_INTERVAL = float(os.getenv("AUTH_KEY_REFRESH_INTERVAL", 3600))
 
 def firebase_auth_required(f):
     @wraps(f)
@@ -8,20 +24,130 @@ def firebase_auth_required(f):
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Unauthorized", "message": "No token provided"}), 401
-        
+
         id_token = auth_header.split('Bearer ')[1]
-        firebase_auth = get_auth()
-        
-        if not firebase_auth:
-            return jsonify({"error": "Service Unavailable", "message": "Firebase Auth not available"}), 503
-        
-        try:
-            decoded_token = firebase_auth.verify_id_token(id_token)
-            g.user = decoded_token['uid']
-            g.user_email = decoded_token.get('email')
-        except Exception as e:
-            return jsonify({"error": "Unauthorized", "message": str(e)}), 401
-            
+        cache_key = hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+        decoded_token = token_cache.get(cache_key)
+
+        if decoded_token is None:
+            firebase_auth = get_auth()
+
+            if not firebase_auth:
+                return jsonify({"error": "Service Unavailable", "message": "Firebase Auth not available"}), 503
+
+            key_refresher.ensure_started()
+            try:
+                decoded_token = firebase_auth.verify_id_token(id_token)
+            except Exception as e:
+                return jsonify({"error": "Unauthorized", "message": str(e)}), 401
+            token_cache.set(cache_key, decoded_token, expires_at=decoded_token['exp'])
+
+        g.user = decoded_token['uid']
+        g.user_id = decoded_token['uid']
+        g.user_email = decoded_token.get('email')
+
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+def metrics_token_required(f):
+    """Protege los endpoints internos con METRICS_TOKEN; responde 404 si no está configurado."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not METRICS_TOKEN:
+            return jsonify({"error": "Not Found"}), 404
+        auth_header = request.headers.get('Authorization') or ''
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+            return jsonify({"error": "Unauthorized", "message": "Invalid metrics token"}), 401
         return f(*args, **kwargs)
-    
+
     return decorated_function
+
+def token_cache_stats():
+    """Aciertos y fallos de la caché de tokens y estado del refresco de claves."""
+    return {**token_cache.stats(), "key_refresh": key_refresher.stats()}
+
+
+class PublicKeyRefresher:
+    """
+    Hilo en segundo plano que vuelve a descargar los certificados públicos con
+    los que Firebase firma los ID tokens antes de que venza la copia en caché,
+    para que la rotación de claves no agregue una descarga a un request.
+
+    El SDK no expone una forma pública de renovar su caché de certificados:
+    se reutiliza la sesión HTTP con caché (CacheControl) de su verificador,
+    que es interna, por eso firebase-admin está acotado a la versión mayor
+    probada en requirements.txt. La cabecera no-cache fuerza la descarga y la
+    respuesta reemplaza a la guardada. Si una versión del SDK ya no tiene esos
+    atributos el refresco se desactiva (ver stats) y la verificación sigue
+    funcionando como antes, descargando las claves cuando vence la caché.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh = None
+        self.disabled = None
+
+    def ensure_started(self):
+        # Los hilos no sobreviven a un fork: se arranca uno por proceso
+        if self._pid == os.getpid() or self.interval <= 0 or self.disabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="firebase-key-refresher", daemon=True).start()
+
+    def stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_refresh": self.last_refresh,
+            "disabled": self.disabled
+        }
+
+    def _run(self):
+        while not self.disabled:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                self.failures += 1
+                print(f"WARNING: could not refresh Firebase public keys: {e}")
+
+    def refresh(self):
+        request, cert_uri = _sdk_cert_request()
+        if request is None:
+            self.disabled = "unsupported firebase_admin version"
+            print("WARNING: Firebase public key refresh disabled: unsupported firebase_admin version")
+            return
+        response = request(cert_uri, headers={'Cache-Control': 'no-cache'})
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        self.refreshes += 1
+        self.last_refresh = time.time()
+
+
+def _sdk_cert_request():
+    """
+    (request, url) con los que el verificador de ID tokens del SDK descarga los
+    certificados, o (None, None) si esta versión de firebase_admin no los tiene.
+    """
+    import firebase_admin
+    from firebase_admin import auth as firebase_auth
+
+    try:
+        from firebase_admin import _token_gen
+        client = firebase_auth._get_client(firebase_admin.get_app())
+        request = client._token_verifier.request
+        return request, _token_gen.ID_TOKEN_CERT_URI
+    except (ImportError, AttributeError):
+        return None, None
+
+
+key_refresher = PublicKeyRefresher(KEY_REFRESH_INTERVAL)
@@ -0,0 +1,95 @@
+import os
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this go out uncompressed (the savings do not pay the CPU)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"}
+
+
+def negotiate_encoding(accept_encodings):
+    """Best encoding accepted by the client: 'br' (if brotli is installed), 'gzip' or None."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return accept_encodings.best_match(offered)
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses an iterable of byte chunks as they are produced. Each chunk is
+    flushed, so the client receives every NDJSON line without waiting for the
+    rest of the stream.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def _weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+def compress_response(response):
+    """
+    after_request hook: compresses text and JSON bodies of at least
+    COMPRESS_MIN_BYTES with the encoding negotiated from Accept-Encoding.
+    Streamed responses (exports, process-batch) are compressed chunk by chunk,
+    since their size is not known up front.
+    The ETag becomes weak, since the bytes differ per encoding; conditional
+    requests still match it (see req_res.not_modified).
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or "Content-Encoding" in response.headers
+            or not 200 <= response.status_code < 300 or response.status_code == 204):
+        return response
+    if response.is_streamed:
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        source = response.response
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        if hasattr(source, "close"):
+            response.call_on_close(source.close)
+        response.headers["Content-Encoding"] = encoding
+        response.headers.pop("Content-Length", None)
+        _weaken_etag(response)
+        return response
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    _weaken_etag(response)
+    return response
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,61 @@
+import os
+import json
+from flask import current_app, has_app_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider of the app (jsonify, success, bad_request) backed by orjson
+    when it is installed, with the stdlib encoder as fallback.
+
+    Output matches the default provider: sorted keys, dates in HTTP format
+    and the same default() for other types. Non-ASCII characters are written
+    as UTF-8 instead of \\u escapes. Values orjson rejects (e.g. integers
+    beyond 64 bits) fall back to the stdlib encoder.
+    Set JSON_ENCODER=stdlib to disable orjson.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = orjson is not None and os.getenv("JSON_ENCODER", "orjson") != "stdlib"
+
+    def encode(self, obj, indent=False):
+        """Serializes obj to UTF-8 bytes."""
+        if self.fast:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                pass
+        if indent:
+            return self.dumps(obj, indent=2).encode()
+        return self.dumps(obj, separators=(",", ":")).encode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.encode(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def encode_json(obj):
+    """
+    Serializes obj to UTF-8 bytes with the app's JSON provider, for bodies
+    written outside jsonify (streamed exports, NDJSON events). Outside an app
+    context it falls back to the stdlib encoder.
+    """
+    if not has_app_context():
+        return json.dumps(obj, ensure_ascii=False, default=str).encode()
+    provider = current_app.json
+    if isinstance(provider, FastJSONProvider):
+        return provider.encode(obj)
+    return provider.dumps(obj).encode()
@@ -1,5 +1,18 @@
+import os
+import json
+import hashlib
+from functools import wraps
 from flask import request, jsonify, make_response
 
+# Tamaño máximo de página en los listados
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 200))
+
+# Políticas de Cache-Control (ver cache_control). Las respuestas son por usuario:
+# ninguna se guarda en cachés compartidas, navegador y proxy revalidan con el ETag
+REVALIDATE = "private, no-cache"
+IMMUTABLE = f"private, max-age={int(os.getenv('IMMUTABLE_MAX_AGE', 86400))}, immutable"
+NO_STORE = "no-store"
+
 def get_json():
     """Returns the JSON payload from the request or an empty dict if it fails."""
     try:
@@ -7,12 +20,76 @@ def get_json():
     except Exception:
         return {}
 
-def success(data, code=200):
-    """Returns a success JSON response."""
-    return make_response(jsonify({
+def get_page_args(default_limit=50):
+    """
+    Reads listing arguments from the query string: limit, start_after and
+    fields (comma separated). Raises ValueError on invalid values.
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    return limit, request.args.get('start_after') or None, fields
+
+def content_etag(data):
+    """Strong ETag (quoted) derived from the JSON content of data."""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return '"' + hashlib.sha256(encoded).hexdigest()[:32] + '"'
+
+def document_etag(doc, key=None):
+    """
+    Strong ETag for a stored document. Documents with updated_at get it from
+    key (default: the document id) and updated_at, without serializing them;
+    older documents fall back to content_etag.
+    """
+    if doc.get("updated_at"):
+        return content_etag([key or doc.get("id"), doc["updated_at"]])
+    return content_etag(doc)
+
+def not_modified(etag):
+    """True when the request's If-None-Match matches etag (a quoted tag)."""
+    return request.if_none_match.contains_weak(etag.strip('"'))
+
+def success(data, code=200, meta=None, etag=None):
+    """
+    Returns a success JSON response. meta (e.g. pagination) is added when given.
+    With etag the response carries it, and a GET whose If-None-Match matches
+    gets a 304 without body (the data is not serialized). The 304 echoes the
+    ETag in the form the client sent, weak if the 200 went out compressed.
+    """
+    if etag is not None and code == 200 and request.method in ("GET", "HEAD") and not_modified(etag):
+        response = make_response("", 304)
+        tag = etag.strip('"')
+        response.set_etag(tag, weak=request.if_none_match.is_weak(tag))
+        return response
+    body = {
         "status": "success",
         "data": data
-    }), code)
+    }
+    if meta is not None:
+        body["meta"] = meta
+    response = make_response(jsonify(body), code)
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return response
+
+def cache_control(policy):
+    """
+    Route decorator: sets Cache-Control to policy on 200 and 304 responses.
+    Errors keep the default headers.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.headers["Cache-Control"] = policy
+            return response
+        return wrapper
+    return decorator
 
 def bad_request(message, code=400):
     """Returns an error JSON response."""
@@ -20,3 +97,13 @@ def bad_request(message, code=400):
         "status": "error",
         "message": message
     }), code)
+
+def timed_out(message="Processing timed out, retry later", code=504):
+    """Returns an error JSON response for work that did not finish in time."""
+    return bad_request(message, code)
+
+def too_busy(retry_after, message="Server is busy, retry later", code=503):
+    """Returns an error JSON response asking the client to retry later."""
+    response = bad_request(message, code)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
@@ -1,15 +1,23 @@
-import io
-from flask import Blueprint, request, send_file, jsonify, g
+import os
+import itertools
+import tempfile
+from flask import Blueprint, Response, request, send_file, jsonify, g, stream_with_context
 from utils.firebase_config import get_db
-import pandas as pd
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from datetime import datetime
-from middlewares.req_res import get_json, success, bad_request
+from middlewares.req_res import get_json, success, bad_request, cache_control, content_etag, REVALIDATE
 from middlewares.auth_middleware import firebase_auth_required
+from services.export_service import EXPORT_FORMATS, iter_samples
+from services.report_service import write_excel, write_pdf
+from services.aggregate_service import month_aggregate, summarize
 
 reportsBp = Blueprint('reports', __name__)
 
+# Documentos leídos de Firestore por página al exportar
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 500))
+
+# Los reportes se arman en memoria hasta este tamaño y luego en un archivo temporal
+REPORT_SPOOL_BYTES = int(os.getenv("REPORT_SPOOL_BYTES", 8 * 1024 * 1024))
+
 @reportsBp.route('/monthly', methods=['GET'])
 @firebase_auth_required
 def generate_monthly_report():
@@ -24,7 +32,14 @@ def generate_monthly_report():
         if not month:
             return bad_request("Month parameter is required (YYYY-MM)")
 
-        # 1. Consultar datos de Firestore
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            return bad_request("Month parameter must be YYYY-MM")
+        if fmt not in ('pdf', 'excel'):
+            return bad_request("Unsupported format. Use 'pdf' or 'excel'.")
+
+        # 1. Consultar datos de Firestore (por páginas, ordenados por fecha)
         start_date = f"{month}-01"
         end_date = f"{month}-31" 
         
@@ -35,72 +50,79 @@ def generate_monthly_report():
         samples_ref = db.collection('samples') \
             .where('user_id', '==', g.user_id) \
             .where('date', '>=', start_date) \
-            .where('date', '<=', end_date)
-        docs = samples_ref.stream()
-        data = [doc.to_dict() for doc in docs]
+            .where('date', '<=', end_date) \
+            .order_by('date')
+        rows = iter_samples(samples_ref, page_size=EXPORT_PAGE_SIZE)
+        first = next(rows, None)
         
-        if not data:
+        if first is None:
             return bad_request("No data found for this month", 404)
 
-        # 2. Generar Reporte
+        # 2. Generar Reporte (en disco si supera REPORT_SPOOL_BYTES)
+        rows = itertools.chain([first], rows)
+        output = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES)
         if fmt == 'excel':
-            df = pd.DataFrame(data)
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Reporte Mensual')
+            write_excel(rows, output)
             output.seek(0)
             return send_file(output, as_attachment=True, download_name=f"reporte_{month}.xlsx", mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            
-        elif fmt == 'pdf':
-            buffer = io.BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.drawString(100, 750, f"Reporte de Larvas - Mes: {month}")
-            p.drawString(100, 730, f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            y = 700
-            for item in data:
-                p.drawString(100, y, f"Fecha: {item.get('date')} - Muestra: {item.get('name')} - Total: {item.get('results', {}).get('total_colonies')}")
-                y -= 20
-                if y < 50:
-                    p.showPage()
-                    y = 750
-            
-            p.save()
-            buffer.seek(0)
-            return send_file(buffer, as_attachment=True, download_name=f"reporte_{month}.pdf", mimetype='application/pdf')
-            
         else:
-            return bad_request("Unsupported format. Use 'pdf' or 'excel'.")
+            write_pdf(rows, output, month)
+            output.seek(0)
+            return send_file(output, as_attachment=True, download_name=f"reporte_{month}.pdf", mimetype='application/pdf')
 
     except Exception as e:
         return bad_request(str(e), 500)
 
+@reportsBp.route('/summary', methods=['GET'])
+@firebase_auth_required
+@cache_control(REVALIDATE)
+def get_summary():
+    """
+    Resumen del mes (cantidad, total, media, máximo, mínimo y por cultivo)
+    leído del agregado mensual del usuario: una sola lectura de documento.
+    Los meses sin agregado todavía se calculan desde sus muestras.
+    """
+    try:
+        month = request.args.get('month', datetime.now().strftime('%Y-%m'))
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            return bad_request("Month parameter must be YYYY-MM")
+
+        db = get_db()
+        if not db:
+            return bad_request("Firestore not available", 503)
+
+        summary = summarize(month_aggregate(db, g.user_id, month), month)
+        return success(summary, etag=content_etag(summary))
+    except Exception as e:
+        return bad_request(str(e), 500)
+
 @reportsBp.route('/export', methods=['GET'])
 @firebase_auth_required
 def export_data():
     """
-    Exporta datos en formatos Rstudio compatible (JSON/CSV) o TOON.
+    Exporta todas las muestras del usuario en formatos Rstudio compatible
+    (JSON/CSV) o NDJSON. La respuesta se genera en streaming mientras se
+    recorre Firestore por páginas, con memoria constante y sin límite de filas.
+    JSON y NDJSON devuelven los documentos completos; el CSV, las columnas de
+    EXPORT_COLUMNS. Un error a mitad termina el cuerpo con un marcador de
+    error (ver export_service).
     """
     fmt = request.args.get('format', 'json').lower()
     try:
+        if fmt not in EXPORT_FORMATS:
+            return bad_request("Format not yet implemented", 501)
         db = get_db()
         if not db:
             return bad_request("Firestore not available", 503)
-            
-        docs = db.collection('samples') \
+
+        query = db.collection('samples') \
             .where('user_id', '==', g.user_id) \
-            .limit(500).stream()
-        data = [doc.to_dict() for doc in docs]
-        
-        if fmt == 'json':
-            return success(data)
-        elif fmt == 'csv':
-            df = pd.DataFrame(data)
-            output = io.BytesIO()
-            df.to_csv(output, index=False)
-            output.seek(0)
-            return send_file(output, as_attachment=True, download_name="export.csv", mimetype='text/csv')
-        else:
-            return bad_request("Format not yet implemented", 501)
+            .order_by('created_at', direction='DESCENDING')
+        writer, mimetype, filename, flatten = EXPORT_FORMATS[fmt]
+        headers = {"Content-Disposition": f"attachment; filename={filename}"} if filename else {}
+        rows = iter_samples(query, page_size=EXPORT_PAGE_SIZE, flatten=flatten)
+        return Response(stream_with_context(writer(rows)), mimetype=mimetype, headers=headers)
     except Exception as e:
         return bad_request(str(e), 500)
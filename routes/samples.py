@@ -1,15 +1,99 @@
 import os
 import uuid
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app, g
+from flask import Blueprint, Response, request, jsonify, current_app, g, stream_with_context
 from utils.firebase_config import get_db, get_bucket
-from services.counter_service import process_sample_image, get_processed_image_visual
-from middlewares.req_res import get_json, success, bad_request
+from services.counter_service import process_sample_image, get_processed_image_visual, render_sector_image, sweep_sample_image, get_encoding, RENDER_MODES
+from services.upload_service import get_uploader, upload_sample_images
+from services.aggregate_service import record_sample, record_sample_edit
+from services.sample_service import build_sample, pending_images, upload_job_for
+from services.batch_process_service import process_batch, MAX_BATCH_IMAGES
+from services.export_service import iter_ndjson
+from utils.cache import LRUCache
+from utils.firestore_utils import fetch_page
+from services.executor_service import run_counter, QueueFullError, CounterTimeoutError
+from middlewares.req_res import (
+    get_json, get_page_args, success, bad_request, too_busy, timed_out, cache_control, content_etag, document_etag,
+    not_modified, REVALIDATE, IMMUTABLE
+)
 from middlewares.auth_middleware import firebase_auth_required
 from flask_cors import cross_origin
 
 samplesBp = Blueprint('samples', __name__)
 
+# Máximo de sensibilidades por llamada a /sweep
+MAX_SWEEP_VALUES = int(os.getenv("MAX_SWEEP_VALUES", 20))
+
+# Subida de imágenes de /process: 'sync' en el request o 'background' (write-behind)
+UPLOAD_MODES = ("sync", "background")
+UPLOAD_MODE = os.getenv("SAMPLE_UPLOAD_MODE", "sync")
+
+# Recortes de sector renderizados bajo demanda (los resultados de una muestra no cambian)
+sector_image_cache = LRUCache(
+    maxsize=int(os.getenv("SECTOR_IMAGE_CACHE_SIZE", 256)),
+    max_bytes=int(os.getenv("SECTOR_IMAGE_CACHE_BYTES", 64 * 1024 * 1024)),
+    sizeof=lambda item: len(item["image_b64"])
+)
+
+def _encoding_from(params):
+    """Lee la configuración de codificación de imagen desde un form o query string."""
+    return get_encoding(
+        params.get('image_format'),
+        params.get('image_quality'),
+        params.get('png_compression')
+    )
+
+def _int_field(params, name, default, minimum=None, maximum=None):
+    """Lee un entero de un form o query string; lanza ValueError si no es válido."""
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be greater than or equal to {minimum}")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be less than or equal to {maximum}")
+    return value
+
+def _area_bounds_from(params):
+    """
+    Lee min_area/max_area opcionales (None = los del entorno).
+    Lanza ValueError si no son enteros válidos.
+    """
+    bounds = []
+    for name in ('min_area', 'max_area'):
+        value = params.get(name)
+        if value is None or value == '':
+            bounds.append(None)
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+        if value < 0:
+            raise ValueError(f"{name} must be greater than or equal to 0")
+        bounds.append(value)
+    min_area, max_area = bounds
+    if min_area is not None and max_area is not None and max_area <= min_area:
+        raise ValueError("max_area must be greater than min_area")
+    return min_area, max_area
+
+def _original_blob_path(sample, bucket):
+    """
+    Ruta del original en Storage; las muestras antiguas solo guardan la URL
+    pública. None si no está disponible o todavía se está subiendo.
+    """
+    if sample.get('status') == 'subiendo':
+        return None
+    if sample.get('original_image_path'):
+        return sample['original_image_path']
+    url = sample.get('original_image_url') or ''
+    marker = f"/{bucket.name}/"
+    return url.split(marker, 1)[1] if marker in url else None
+
 @samplesBp.route('/process', methods=['POST'])
 @firebase_auth_required
 @cross_origin(supports_credentials=True)
@@ -32,57 +116,212 @@ def process_sample():
         crop_type = request.form.get('crop_type', 'default')
         crop_state = request.form.get('crop_state', 'default')
         notes = request.form.get('notes', '')
+        render = request.form.get('render', 'full')
+        tiled = request.form.get('tiled', 'false').lower() in ('1', 'true', 'yes')
+        if render not in RENDER_MODES:
+            return bad_request(f"Invalid render mode. Use one of: {', '.join(RENDER_MODES)}")
+        try:
+            encoding = _encoding_from(request.form)
+            # Límites de área de blob opcionales; por defecto los del entorno
+            min_area, max_area = _area_bounds_from(request.form)
+        except ValueError as e:
+            return bad_request(str(e))
 
         # 1. Procesar imagen
-        results = process_sample_image(image_bytes, sectors=sectors, sensitivity=sensitivity)
+        try:
+            results = run_counter(process_sample_image, image_bytes, sectors=sectors, sensitivity=sensitivity, render=render, encoding=encoding, tiled=tiled, min_area=min_area, max_area=max_area)
+        except QueueFullError as e:
+            return too_busy(e.retry_after)
+        except CounterTimeoutError:
+            return timed_out()
         
         # 3. Guardar en Storage (Imagen Original)
         unique_id = str(uuid.uuid4())
         user_id = g.user_id
-        original_blob_path = f"users/{user_id}/samples/{unique_id}/original_{filename}"
+        upload_mode = request.form.get('upload', UPLOAD_MODE)
+        if upload_mode not in UPLOAD_MODES:
+            return bad_request(f"Invalid upload mode. Use one of: {', '.join(UPLOAD_MODES)}")
         
         bucket = get_bucket()
         if not bucket:
             return bad_request("Firebase Storage not available", 503)
 
-        blob = bucket.blob(original_blob_path)
-        blob.upload_from_string(image_bytes, content_type=image_file.content_type)
-        blob.make_public()
-        original_url = blob.public_url
-
-        # 4. Guardar en Firestore
         db = get_db()
         if not db:
             return bad_request("Firestore not available", 503)
-            
-        sample_data = {
-            "id": unique_id,
-            "user_id": user_id,
-            "name": sample_name,
-            "date": datetime.now().strftime('%Y-%m-%d'),
-            "time": datetime.now().strftime('%H:%M:%S'),
-            "crop_type": crop_type,
-            "crop_state": crop_state,
-            "original_image_url": original_url,
-            "processed_image_b64": results["processed_image_b64"], # Nueva imagen visualizada
-            "results": {
-                "total_colonies": results["total"],
-                "sectors": results["sectors_data"],
-                "stats": results["stats"],
-                "grid": results["grid"]
+
+        upload_job = upload_job_for(unique_id, user_id, filename, image_bytes, image_file.content_type, results, encoding)
+        background = upload_mode == 'background'
+        if background:
+            # Las URLs se completan cuando termina la subida en segundo plano
+            images = pending_images(results)
+        else:
+            images = upload_sample_images(bucket, upload_job)
+
+        # 4. Guardar en Firestore
+        sample_data = build_sample(
+            unique_id, user_id, upload_job, results, images,
+            params={
+                "sectors": sectors,
+                "sensitivity": sensitivity,
+                "render": render,
+                "tiled": tiled,
+                "min_area": min_area,
+                "max_area": max_area
             },
-            "notes": notes,
-            "status": "completado",
-            "created_at": datetime.now().isoformat()
-        }
+            name=sample_name,
+            crop_type=crop_type,
+            crop_state=crop_state,
+            notes=notes,
+            status="subiendo" if background else "completado"
+        )
         
-        db.collection('samples').document(unique_id).set(sample_data)
+        sample_ref = db.collection('samples').document(unique_id)
+        record_sample(db, sample_ref, sample_data)
 
+        # El documento ya existe cuando el uploader lo actualiza; con la cola llena se sube aquí
+        if background and not get_uploader().submit(upload_job):
+            images = upload_sample_images(bucket, upload_job)
+            updated_at = datetime.now().isoformat()
+            sample_ref.update({**images, "status": "completado", "updated_at": updated_at})
+            sample_data.update({
+                "original_image_url": images["original_image_url"],
+                "processed_image_url": images["processed_image_url"],
+                "processed_image_size": images["processed_image_size"],
+                "status": "completado",
+                "updated_at": updated_at
+            })
+            sample_data["results"]["sectors"] = images["results.sectors"]
+
+        if render == 'counts':
+            # Las coordenadas solo viajan en la respuesta (Firestore no admite listas anidadas)
+            return success({**sample_data, "points": [list(p) for p in results["points"]]}, 201)
         return success(sample_data, 201)
 
     except Exception as e:
         return bad_request(str(e), 500)
 
+@samplesBp.route('/process-batch', methods=['POST'])
+@firebase_auth_required
+@cross_origin(supports_credentials=True)
+def process_sample_batch():
+    """
+    Procesa varias imágenes ('images') con los mismos parámetros que /process
+    y responde en NDJSON: una línea por muestra a medida que queda guardada
+    (o por imagen que falla) y una línea final con el resumen.
+    """
+    try:
+        files = [f for f in request.files.getlist('images') if f.filename]
+        if not files:
+            return bad_request("No images provided")
+        if len(files) > MAX_BATCH_IMAGES:
+            return bad_request(f"At most {MAX_BATCH_IMAGES} images per request")
+
+        render = request.form.get('render', 'full')
+        if render not in RENDER_MODES:
+            return bad_request(f"Invalid render mode. Use one of: {', '.join(RENDER_MODES)}")
+        try:
+            encoding = _encoding_from(request.form)
+            min_area, max_area = _area_bounds_from(request.form)
+            params = {
+                "sectors": _int_field(request.form, 'sectors', 1, minimum=1),
+                "sensitivity": _int_field(request.form, 'sensitivity', 50, minimum=0, maximum=100),
+                "render": render,
+                "tiled": request.form.get('tiled', 'false').lower() in ('1', 'true', 'yes'),
+                "min_area": min_area,
+                "max_area": max_area
+            }
+        except ValueError as e:
+            return bad_request(str(e))
+
+        bucket = get_bucket()
+        if not bucket:
+            return bad_request("Firebase Storage not available", 503)
+        db = get_db()
+        if not db:
+            return bad_request("Firestore not available", 503)
+
+        events = process_batch(
+            files, g.user_id, db, bucket, params, encoding,
+            crop_type=request.form.get('crop_type', 'default'),
+            crop_state=request.form.get('crop_state', 'default'),
+            notes=request.form.get('notes', ''),
+            name=request.form.get('name')
+        )
+        return Response(stream_with_context(iter_ndjson(events)), mimetype="application/x-ndjson")
+    except Exception as e:
+        return bad_request(str(e), 500)
+
+@samplesBp.route('/sweep', methods=['POST'])
+@firebase_auth_required
+@cross_origin(supports_credentials=True)
+def sweep_sample():
+    """
+    Cuenta una imagen con varias sensibilidades en una sola llamada.
+    Acepta una imagen nueva ('image') o una muestra existente ('sample_id').
+    """
+    try:
+        try:
+            sensitivities = [int(v) for v in request.form.get('sensitivities', '').split(',') if v.strip()]
+        except ValueError:
+            return bad_request("sensitivities must be a comma separated list of integers")
+        if not sensitivities:
+            return bad_request("No sensitivities provided")
+        if len(sensitivities) > MAX_SWEEP_VALUES:
+            return bad_request(f"At most {MAX_SWEEP_VALUES} sensitivities per request")
+        if any(not 0 <= v <= 100 for v in sensitivities):
+            return bad_request("Sensitivities must be between 0 and 100")
+
+        try:
+            sectors = _int_field(request.form, 'sectors', 1, minimum=1)
+        except ValueError as e:
+            return bad_request(str(e))
+
+        area_params = {name: request.form.get(name) for name in ('min_area', 'max_area')}
+        if 'image' in request.files:
+            image_bytes = request.files['image'].read()
+        elif request.form.get('sample_id'):
+            db = get_db()
+            bucket = get_bucket()
+            if not db or not bucket:
+                return bad_request("Firebase not available", 503)
+
+            doc = db.collection('samples').document(request.form['sample_id']).get()
+            if not doc.exists:
+                return bad_request("Sample not found", 404)
+            data = doc.to_dict()
+            if data.get('user_id') != g.user_id:
+                return bad_request("Unauthorized access to this sample", 403)
+
+            blob_path = _original_blob_path(data, bucket)
+            if not blob_path:
+                return bad_request("Original image not available for this sample", 404)
+            image_bytes = bucket.blob(blob_path).download_as_bytes()
+            if 'sectors' not in request.form:
+                sectors = data.get('params', {}).get('sectors', sectors)
+            # Sin valores en el formulario se usan los límites con los que se procesó la muestra
+            for name, value in area_params.items():
+                if value is None or value == '':
+                    area_params[name] = data.get('params', {}).get(name)
+        else:
+            return bad_request("No image or sample_id provided")
+
+        try:
+            min_area, max_area = _area_bounds_from(area_params)
+        except ValueError as e:
+            return bad_request(str(e))
+
+        try:
+            result = run_counter(sweep_sample_image, image_bytes, sensitivities, sectors=sectors,
+                                 min_area=min_area, max_area=max_area)
+        except QueueFullError as e:
+            return too_busy(e.retry_after)
+        except CounterTimeoutError:
+            return timed_out()
+        return success(result)
+    except Exception as e:
+        return bad_request(str(e), 500)
+
 @samplesBp.route('/', methods=['GET'])
 @firebase_auth_required
 @cross_origin(supports_credentials=True)
@@ -92,19 +331,27 @@ def get_samples():
         if not db:
             return bad_request("Firestore not available", 503)
             
-        samples_ref = db.collection('samples') \
+        try:
+            limit, cursor, fields = get_page_args()
+        except ValueError as e:
+            return bad_request(str(e))
+
+        samples_col = db.collection('samples')
+        samples_ref = samples_col \
             .where('user_id', '==', g.user_id) \
-            .order_by('created_at', direction='DESCENDING').limit(50)
-        docs = samples_ref.stream()
-        
-        samples_list = [doc.to_dict() for doc in docs]
-        return success(samples_list)
+            .order_by('created_at', direction='DESCENDING')
+        try:
+            samples_list, next_cursor = fetch_page(samples_col, samples_ref, limit, cursor, fields, owner=g.user_id)
+        except ValueError as e:
+            return bad_request(str(e))
+        return success(samples_list, meta={"limit": limit, "next_cursor": next_cursor})
     except Exception as e:
         return bad_request(str(e), 500)
 
 @samplesBp.route('/<sample_id>', methods=['GET'])
 @firebase_auth_required
 @cross_origin(supports_credentials=True)
+@cache_control(REVALIDATE)
 def get_sample(sample_id):
     try:
         db = get_db()
@@ -121,7 +368,70 @@ def get_sample(sample_id):
         if data.get('user_id') != g.user_id:
             return bad_request("Unauthorized access to this sample", 403)
             
-        return success(data)
+        # Los results no cambian; el ETag cambia con updated_at (ediciones, fin de la subida)
+        return success(data, etag=document_etag(data, key=sample_id))
+    except Exception as e:
+        return bad_request(str(e), 500)
+
+@samplesBp.route('/<sample_id>/sectors/<int:sector>/image', methods=['GET'])
+@firebase_auth_required
+@cross_origin(supports_credentials=True)
+@cache_control(IMMUTABLE)
+def get_sector_image(sample_id, sector):
+    """
+    Renderiza bajo demanda el recorte anotado de un sector y lo guarda en caché.
+    """
+    try:
+        try:
+            encoding = _encoding_from(request.args)
+        except ValueError as e:
+            return bad_request(str(e))
+
+        db = get_db()
+        if not db:
+            return bad_request("Firestore not available", 503)
+
+        doc = db.collection('samples').document(sample_id).get()
+        if not doc.exists:
+            return bad_request("Sample not found", 404)
+
+        data = doc.to_dict()
+        if data.get('user_id') != g.user_id:
+            return bad_request("Unauthorized access to this sample", 403)
+
+        params = data.get('params', {})
+        sectors = params.get('sectors') or len(data.get('results', {}).get('sectors', [])) or 1
+        sensitivity = params.get('sensitivity', 50)
+        if not 1 <= sector <= sectors:
+            return bad_request("Sector out of range", 404)
+
+        cache_key = (sample_id, sector, encoding["format"], encoding["quality"], encoding["png_compression"])
+        # El recorte depende solo del original, los parámetros y la codificación, que no cambian
+        etag = content_etag([*cache_key, params])
+        if not_modified(etag):
+            return success(None, etag=etag)
+        cached = sector_image_cache.get(cache_key)
+        if cached is not None:
+            return success(cached, etag=etag)
+
+        bucket = get_bucket()
+        if not bucket:
+            return bad_request("Firebase Storage not available", 503)
+
+        blob_path = _original_blob_path(data, bucket)
+        if not blob_path:
+            return bad_request("Original image not available for this sample", 404)
+        image_bytes = bucket.blob(blob_path).download_as_bytes()
+
+        try:
+            result = run_counter(render_sector_image, image_bytes, sector, sectors=sectors, sensitivity=sensitivity, encoding=encoding, tiled=params.get('tiled', False),
+                                 min_area=params.get('min_area'), max_area=params.get('max_area'))
+        except QueueFullError as e:
+            return too_busy(e.retry_after)
+        except CounterTimeoutError:
+            return timed_out()
+        sector_image_cache.set(cache_key, result)
+        return success(result, etag=etag)
     except Exception as e:
         return bad_request(str(e), 500)
 
@@ -160,7 +470,8 @@ def update_sample(sample_id):
             updates['notes'] = data['notes'] # Las notas sí se pueden sobreescribir según acuerdo
             
         if updates:
-            sample_ref.update(updates)
+            updates['updated_at'] = datetime.now().isoformat()
+            record_sample_edit(db, sample_ref, updates)
             
         return success({"message": "Sample updated", "updates": updates})
     except Exception as e:
@@ -1,60 +1,17 @@
 import os
 import uuid
-import threading
-import pandas as pd
-import io
 from datetime import datetime
 from flask import Blueprint, request, jsonify, g
 from utils.firebase_config import get_db, get_bucket
-from services.counter_service import process_sample_image
-from middlewares.req_res import get_json, success, bad_request
+from utils.firestore_utils import fetch_page
+from services.counter_service import RENDER_MODES
+from services.job_queue import get_job_queue
+from services.massive_service import JOB_KIND
+from middlewares.req_res import get_json, get_page_args, success, bad_request
 from middlewares.auth_middleware import firebase_auth_required
 
 tasksBp = Blueprint('tasks', __name__)
 
-def run_massive_processing(task_id, file_bytes, filename, extension, user_id):
-    """
-    Función que corre en un hilo separado para procesar el archivo CSV/Excel.
-    """
-    try:
-        # 1. Leer archivo
-        if extension == 'csv':
-            df = pd.read_csv(io.BytesIO(file_bytes))
-        else:
-            df = pd.read_excel(io.BytesIO(file_bytes))
-            
-        # El archivo debería tener una columna con URLs de imágenes o similar.
-        # Por ahora, simularemos que procesamos cada fila del archivo.
-        
-        total_rows = len(df)
-        db = get_db()
-        if not db:
-            print("Error: Firestore not available for task background processing")
-            return
-
-        db.collection('tasks').document(task_id).update({
-            "status": "en progreso",
-            "total_items": total_rows,
-            "processed_items": 0
-        })
-        
-        # Simulación de procesamiento
-        # ...
-        
-        db.collection('tasks').document(task_id).update({
-            "status": "completado",
-            "processed_items": total_rows,
-            "completed_at": datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        db = get_db()
-        if db:
-            db.collection('tasks').document(task_id).update({
-                "status": "error",
-                "error_message": str(e)
-            })
-
 @tasksBp.route('/massive', methods=['POST'])
 @firebase_auth_required
 def create_massive_task():
@@ -69,6 +26,13 @@ def create_massive_task():
         if extension not in ['csv', 'xlsx', 'xls']:
             return bad_request("Invalid file format. Use CSV or Excel.")
             
+        # Valores por defecto para las filas sin columnas sectors/sensitivity
+        sectors = int(request.form.get('sectors', 1))
+        sensitivity = int(request.form.get('sensitivity', 50))
+        render = request.form.get('render', 'full')
+        if render not in RENDER_MODES:
+            return bad_request(f"Invalid render mode. Use one of: {', '.join(RENDER_MODES)}")
+            
         file_bytes = file.read()
         task_id = str(uuid.uuid4())
         user_id = g.user_id
@@ -97,13 +61,26 @@ def create_massive_task():
             "status": "pendiente",
             "file_url": file_url,
             "created_at": datetime.now().isoformat(),
-            "type": "massive_processing"
+            "type": JOB_KIND,
+            "params": {
+                "sectors": sectors,
+                "sensitivity": sensitivity,
+                "render": render
+            }
         }
         db.collection('tasks').document(task_id).set(task_data)
         
-        # 3. Lanzar procesamiento en segundo plano
-        # thread = threading.Thread(target=run_massive_processing, args=(task_id, file_bytes, filename, extension, user_id))
-        # thread.start()
+        # 3. Encolar el procesamiento (lo ejecuta flask --app main massive-worker)
+        get_job_queue().enqueue(task_id, JOB_KIND, {
+            "task_id": task_id,
+            "user_id": user_id,
+            "blob_path": blob_path,
+            "filename": filename,
+            "extension": extension,
+            "sectors": sectors,
+            "sensitivity": sensitivity,
+            "render": render
+        })
         
         return success({
             "message": "Task created and processing started",
@@ -121,10 +98,19 @@ def get_tasks():
         if not db:
             return jsonify({"error": "Firestore not available"}), 503
             
-        tasks_ref = db.collection('tasks') \
+        try:
+            limit, cursor, fields = get_page_args()
+        except ValueError as e:
+            return bad_request(str(e))
+
+        tasks_col = db.collection('tasks')
+        tasks_ref = tasks_col \
             .where('user_id', '==', g.user_id) \
             .order_by('created_at', direction='DESCENDING')
-        docs = tasks_ref.stream()
-        return success([doc.to_dict() for doc in docs])
+        try:
+            tasks_list, next_cursor = fetch_page(tasks_col, tasks_ref, limit, cursor, fields, owner=g.user_id)
+        except ValueError as e:
+            return bad_request(str(e))
+        return success(tasks_list, meta={"limit": limit, "next_cursor": next_cursor})
     except Exception as e:
         return bad_request(str(e), 500)
@@ -1,13 +1,42 @@
+import os
 from flask import Blueprint, g
 from utils.firebase_config import get_db
+from utils.cache import LRUCache
 from middlewares.auth_middleware import firebase_auth_required
-from middlewares.req_res import get_json, success, bad_request
+from middlewares.req_res import get_json, success, bad_request, cache_control, content_etag, REVALIDATE
 
 usersBp = Blueprint('users', __name__)
 
+# Perfiles por uid como (perfil, etag). Se actualizan al escribir desde este
+# proceso; los cambios hechos por otro proceso se ven al vencer el TTL.
+profile_cache = LRUCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", 60))
+)
+
+def _merge(target, updates):
+    """Aplica updates sobre target como set(..., merge=True): los mapas se combinan."""
+    merged = dict(target)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def _cache_profile(user_id, profile):
+    entry = (profile, content_etag(profile))
+    profile_cache.set(user_id, entry)
+    return entry
+
 @usersBp.route('/profile', methods=['GET'])
 @firebase_auth_required
+@cache_control(REVALIDATE)
 def get_profile():
+    cached = profile_cache.get(g.user_id)
+    if cached is not None:
+        return success(cached[0], etag=cached[1])
+
     db = get_db()
     if not db:
         return bad_request("Firestore not available", 503)
@@ -29,9 +58,11 @@ def get_profile():
             }
         }
         user_ref.set(default_profile)
-        return success(default_profile)
+        profile, etag = _cache_profile(g.user_id, default_profile)
+        return success(profile, etag=etag)
         
-    return success(doc.to_dict())
+    profile, etag = _cache_profile(g.user_id, doc.to_dict())
+    return success(profile, etag=etag)
 
 @usersBp.route('/profile', methods=['PUT'])
 @firebase_auth_required
@@ -52,5 +83,9 @@ def update_profile():
 
     if allowed_updates:
         user_ref.set(allowed_updates, merge=True)
+        # Write-through: el perfil en caché refleja la escritura sin volver a leerlo
+        cached = profile_cache.get(g.user_id)
+        if cached is not None:
+            _cache_profile(g.user_id, _merge(cached[0], allowed_updates))
         
     return success({"message": "Profile updated", "data": allowed_updates})
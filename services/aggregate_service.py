@@ -0,0 +1,253 @@
+from datetime import datetime
+from google.cloud.firestore_v1 import Increment, transactional
+from google.cloud.firestore_v1.field_path import FieldPath
+from utils.firestore_utils import iter_documents
+
+# Un documento por usuario y mes: {user_id}_{YYYY-MM}
+AGGREGATES_COLLECTION = 'monthly_aggregates'
+
+
+def sample_total(sample):
+    """Total efectivo de una muestra: la edición manual si existe, si no el conteo."""
+    value = sample.get('edited_total_colonies')
+    if value is None:
+        value = (sample.get('results') or {}).get('total_colonies')
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+def sample_month(sample):
+    return (sample.get('date') or '')[:7]
+
+def aggregate_ref(db, user_id, month):
+    return db.collection(AGGREGATES_COLLECTION).document(f"{user_id}_{month}")
+
+def month_samples(db, user_id, month):
+    """Consulta de las muestras de un usuario en un mes (date es YYYY-MM-DD)."""
+    return db.collection('samples') \
+        .where('user_id', '==', user_id) \
+        .where('date', '>=', f"{month}-01") \
+        .where('date', '<=', f"{month}-31")
+
+def empty_aggregate(user_id, month):
+    return {
+        "user_id": user_id,
+        "month": month,
+        "count": 0,
+        "total_colonies": 0,
+        # Cantidad de muestras por total: permite mantener min/max al editar o quitar
+        "histogram": {},
+        "crops": {}
+    }
+
+def apply_sample(aggregate, sample, sign=1, prune=True):
+    """
+    Suma (sign=1) o resta (sign=-1) una muestra del agregado, en el lugar.
+    Con prune=False se conservan las entradas en cero o negativas, como en
+    los deltas que se aplican con Increment (ver aggregate_increments).
+    """
+    total = sample_total(sample)
+    crop = sample.get('crop_type') or 'default'
+
+    aggregate["count"] += sign
+    aggregate["total_colonies"] += sign * total
+
+    histogram = aggregate["histogram"]
+    key = _histogram_key(total)
+    histogram[key] = histogram.get(key, 0) + sign
+    if prune and histogram[key] <= 0:
+        del histogram[key]
+
+    crops = aggregate["crops"]
+    entry = crops.setdefault(crop, {"count": 0, "total_colonies": 0})
+    entry["count"] += sign
+    entry["total_colonies"] += sign * total
+    if prune and entry["count"] <= 0:
+        del crops[crop]
+
+    aggregate["updated_at"] = datetime.now().isoformat()
+    return aggregate
+
+def _histogram_key(total):
+    # Sin punto decimal para los enteros: la clave también es un segmento de ruta de campo
+    return str(int(total)) if float(total).is_integer() else str(total)
+
+def aggregate_increments(delta):
+    """
+    Convierte un delta (apply_sample con prune=False sobre empty_aggregate)
+    en campos para set(..., merge=True) con Increment, de modo que varios
+    escritores puedan sumar al mismo agregado sin leerlo.
+
+    Los mapas sin deltas distintos de cero se omiten: con merge=True un mapa
+    vacío reemplaza al guardado (p.ej. al reprocesar muestras con replace=True
+    que dan los mismos totales se borraría el histograma).
+    """
+    fields = {
+        "user_id": delta["user_id"],
+        "month": delta["month"],
+        "count": Increment(delta["count"]),
+        "total_colonies": Increment(delta["total_colonies"]),
+        "updated_at": datetime.now().isoformat()
+    }
+    histogram = {k: Increment(v) for k, v in delta["histogram"].items() if v}
+    if histogram:
+        fields["histogram"] = histogram
+    crops = {
+        crop: {"count": Increment(entry["count"]), "total_colonies": Increment(entry["total_colonies"])}
+        for crop, entry in delta["crops"].items() if entry["count"] or entry["total_colonies"]
+    }
+    if crops:
+        fields["crops"] = crops
+    return fields
+
+def _as_number(value):
+    return int(value) if value.is_integer() else value
+
+def summarize(aggregate, month):
+    """
+    Respuesta de /api/reports/summary a partir del documento agregado.
+    Máximo y mínimo salen del histograma (las entradas en cero quedan de
+    los Increment y se ignoran).
+    """
+    aggregate = aggregate or {}
+    count = aggregate.get("count", 0)
+    total = aggregate.get("total_colonies", 0)
+    values = [float(k) for k, n in (aggregate.get("histogram") or {}).items() if n > 0]
+    return {
+        "month": month,
+        "count": count,
+        "total_colonies": total,
+        "mean": total / count if count else 0.0,
+        "max": _as_number(max(values)) if values else None,
+        "min": _as_number(min(values)) if values else None,
+        "crops": {
+            crop: {**entry, "mean": entry["total_colonies"] / entry["count"]}
+            for crop, entry in (aggregate.get("crops") or {}).items() if entry.get("count", 0) > 0
+        },
+        "updated_at": aggregate.get("updated_at")
+    }
+
+def month_aggregate(db, user_id, month):
+    """
+    Agregado del mes para /api/reports/summary: el documento guardado o, si
+    todavía no existe, el calculado desde las muestras del mes (sin guardarlo).
+    """
+    snapshot = aggregate_ref(db, user_id, month).get()
+    if snapshot.exists:
+        return snapshot.to_dict()
+    aggregate = empty_aggregate(user_id, month)
+    for doc in month_samples(db, user_id, month).stream():
+        apply_sample(aggregate, doc.to_dict())
+    return aggregate
+
+def _read_aggregate(transaction, db, user_id, month):
+    """
+    Agregado del mes leído en la transacción. Si todavía no existe (mes no
+    reconstruido) se calcula desde las muestras del mes, también dentro de la
+    transacción, para no crear un agregado parcial con una sola muestra.
+    """
+    snapshot = aggregate_ref(db, user_id, month).get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict(), True
+    aggregate = empty_aggregate(user_id, month)
+    for doc in month_samples(db, user_id, month).stream(transaction=transaction):
+        apply_sample(aggregate, doc.to_dict())
+    return aggregate, False
+
+@transactional
+def _ensure_aggregate(transaction, db, user_id, month):
+    aggregate, existed = _read_aggregate(transaction, db, user_id, month)
+    if not existed:
+        transaction.set(aggregate_ref(db, user_id, month), aggregate)
+
+def ensure_aggregates(db, keys):
+    """
+    Crea desde las muestras los agregados (user_id, month) que aún no existen,
+    para que los Increment de batch_writer se sumen a un total completo.
+    """
+    keys = list(keys)
+    refs = [aggregate_ref(db, user_id, month) for user_id, month in keys]
+    existing = {snapshot.id for snapshot in db.get_all(refs) if snapshot.exists}
+    for (user_id, month), ref in zip(keys, refs):
+        if ref.id not in existing:
+            _ensure_aggregate(db.transaction(), db, user_id, month)
+
+@transactional
+def _record_sample(transaction, db, sample_ref, sample_data):
+    user_id, month = sample_data["user_id"], sample_month(sample_data)
+    agg_ref = aggregate_ref(db, user_id, month)
+    # La muestra nueva todavía no está escrita: si se reconstruye el mes no la incluye
+    aggregate, _ = _read_aggregate(transaction, db, user_id, month)
+    transaction.set(sample_ref, sample_data)
+    transaction.set(agg_ref, apply_sample(aggregate, sample_data))
+
+def record_sample(db, sample_ref, sample_data):
+    """
+    Guarda una muestra nueva y la suma al agregado de su mes en una
+    transacción. Para muchas muestras ver batch_writer.SampleWriter.
+    """
+    _record_sample(db.transaction(), db, sample_ref, sample_data)
+
+@transactional
+def _record_sample_edit(transaction, db, sample_ref, updates):
+    snapshot = sample_ref.get(transaction=transaction)
+    before = snapshot.to_dict()
+    after = {**before, **updates}
+    changed = sample_total(before) != sample_total(after) or before.get('crop_type') != after.get('crop_type')
+
+    if changed:
+        user_id, month = before["user_id"], sample_month(before)
+        # Un mes reconstruido ya incluye la versión anterior de la muestra
+        aggregate, _ = _read_aggregate(transaction, db, user_id, month)
+        aggregate = apply_sample(aggregate, before, sign=-1)
+        transaction.set(aggregate_ref(db, user_id, month), apply_sample(aggregate, after))
+    transaction.update(sample_ref, updates)
+
+def record_sample_edit(db, sample_ref, updates):
+    """Aplica updates a una muestra y ajusta el agregado de su mes en una transacción."""
+    _record_sample_edit(db.transaction(), db, sample_ref, updates)
+
+def rebuild_aggregates(db, user_id=None, page_size=500):
+    """
+    Recalcula los agregados mensuales desde 'samples' (todos o los de un
+    usuario) y borra los que ya no tienen muestras. Los agregados caben en
+    memoria: uno por usuario y mes. Las muestras creadas mientras corre
+    pueden quedar fuera; conviene ejecutarlo con poco tráfico.
+    """
+    query = db.collection('samples')
+    if user_id:
+        query = query.where('user_id', '==', user_id)
+    query = query.order_by(FieldPath.document_id())
+
+    aggregates = {}
+    stats = {"samples": 0, "aggregates": 0, "deleted": 0}
+    for doc in iter_documents(query, page_size=page_size):
+        sample = doc.to_dict()
+        key = (sample.get('user_id'), sample_month(sample))
+        if not all(key):
+            continue
+        stats["samples"] += 1
+        apply_sample(aggregates.setdefault(key, empty_aggregate(*key)), sample)
+
+    existing = db.collection(AGGREGATES_COLLECTION)
+    if user_id:
+        existing = existing.where('user_id', '==', user_id)
+    stale = [doc.reference for doc in existing.stream() if (doc.get('user_id'), doc.get('month')) not in aggregates]
+
+    batch, pending = db.batch(), 0
+    for (uid, month), aggregate in aggregates.items():
+        batch.set(aggregate_ref(db, uid, month), aggregate)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    for ref in stale:
+        batch.delete(ref)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+
+    stats["aggregates"] = len(aggregates)
+    stats["deleted"] = len(stale)
+    return stats
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from services.counter_service import process_sample_image
+from services.executor_service import get_counter_executor, QueueFullError
+from services.upload_service import upload_samples_images
+from services.sample_service import build_sample, upload_job_for
+from services.batch_writer import SampleWriter
+
+# Máximo de imágenes por llamada a /process-batch
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", 100))
+
+# Muestras por grupo de subida y WriteBatch, y espera máxima de un grupo incompleto
+BATCH_COMMIT_SIZE = int(os.getenv("BATCH_COMMIT_SIZE", 10))
+BATCH_COMMIT_INTERVAL = float(os.getenv("BATCH_COMMIT_INTERVAL", 1.0))
+
+# Reintentos de una imagen rechazada por el pool del contador (cola llena)
+BATCH_BUSY_RETRIES = 3
+
+
+def process_batch(files, user_id, db, bucket, params, encoding, crop_type='default',
+                  crop_state='default', notes='', name=None):
+    """
+    Procesa varias imágenes del mismo usuario y genera un evento por imagen
+    a medida que su muestra queda guardada:
+
+        {"type": "sample", "index", "filename", "data"}
+        {"type": "error", "index", "filename", "error"}
+
+    y al final {"type": "done", "processed", "failed", "write_stats"}.
+
+    Las imágenes se cuentan en paralelo en el pool del contador (tantas a la
+    vez como procesos tiene). Las muestras listas se guardan por grupos de
+    hasta BATCH_COMMIT_SIZE: una pasada de subida paralela para todos sus
+    blobs y un único WriteBatch con las muestras y sus agregados. Un grupo
+    incompleto se guarda tras BATCH_COMMIT_INTERVAL segundos.
+
+    files son objetos con filename, content_type y read() (FileStorage).
+    """
+    executor = get_counter_executor()
+    writer = SampleWriter(db, batch_size=len(files) + 1)
+    pending = []
+    processed = failed = 0
+    oldest = None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(executor.max_workers or 1, len(files)))) as pool:
+        futures = {
+            pool.submit(_count, executor, file, params, encoding): (index, file)
+            for index, file in enumerate(files)
+        }
+        not_done = set(futures)
+        while not_done or pending:
+            if not_done:
+                timeout = None if oldest is None else max(0.0, oldest + BATCH_COMMIT_INTERVAL - time.monotonic())
+                done, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                done = set()
+
+            for future in done:
+                index, file = futures[future]
+                try:
+                    image_bytes, results = future.result()
+                except Exception as e:
+                    failed += 1
+                    yield {"type": "error", "index": index, "filename": file.filename, "error": str(e)}
+                    continue
+                sample_id = str(uuid.uuid4())
+                upload_job = upload_job_for(sample_id, user_id, file.filename, image_bytes, file.content_type, results, encoding)
+                pending.append((index, file.filename, upload_job, results))
+                if oldest is None:
+                    oldest = time.monotonic()
+
+            if pending and (not not_done or len(pending) >= BATCH_COMMIT_SIZE
+                            or time.monotonic() - oldest >= BATCH_COMMIT_INTERVAL):
+                group, pending, oldest = pending, [], None
+                try:
+                    samples = _commit(db, bucket, writer, group, user_id, params, crop_type, crop_state, notes, name)
+                except Exception as e:
+                    failed += len(group)
+                    for index, filename, _, _ in group:
+                        yield {"type": "error", "index": index, "filename": filename, "error": str(e)}
+                    continue
+                processed += len(group)
+                for (index, filename, _, _), sample_data in zip(group, samples):
+                    yield {"type": "sample", "index": index, "filename": filename, "data": sample_data}
+
+    yield {"type": "done", "processed": processed, "failed": failed, "write_stats": writer.stats()}
+
+def _count(executor, file, params, encoding):
+    image_bytes = file.read()
+    for attempt in range(BATCH_BUSY_RETRIES + 1):
+        try:
+            return image_bytes, executor.run(
+                process_sample_image, image_bytes, sectors=params["sectors"], sensitivity=params["sensitivity"],
+                render=params["render"], encoding=encoding, tiled=params["tiled"],
+                min_area=params["min_area"], max_area=params["max_area"]
+            )
+        except QueueFullError as e:
+            if attempt == BATCH_BUSY_RETRIES:
+                raise RuntimeError("Counter pool busy, try again later")
+            time.sleep(e.retry_after)
+
+def _commit(db, bucket, writer, group, user_id, params, crop_type, crop_state, notes, name):
+    """Sube las imágenes del grupo y guarda sus muestras; devuelve los documentos."""
+    images = upload_samples_images(bucket, [upload_job for _, _, upload_job, _ in group])
+    samples = []
+    for (index, filename, upload_job, results), fields in zip(group, images):
+        sample_data = build_sample(
+            upload_job["sample_id"], user_id, upload_job, results, fields,
+            params=params,
+            name=f"{name} #{index + 1}" if name else os.path.splitext(filename or '')[0] or f"sample_{index + 1}",
+            crop_type=crop_type,
+            crop_state=crop_state,
+            notes=notes
+        )
+        writer.add(db.collection('samples').document(sample_data["id"]), sample_data)
+        if params["render"] == 'counts':
+            # Como en /process: las coordenadas solo viajan en la respuesta
+            sample_data = {**sample_data, "points": [list(p) for p in results["points"]]}
+        samples.append(sample_data)
+    writer.flush()
+    return samples
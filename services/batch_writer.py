@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+from services.aggregate_service import (
+    aggregate_ref, aggregate_increments, apply_sample, empty_aggregate, ensure_aggregates, sample_month
+)
+
+# Límite de operaciones de un WriteBatch de Firestore
+MAX_BATCH_WRITES = 500
+
+
+class SampleWriter:
+    """
+    Escribe muestras en lotes: acumula los documentos y en cada flush() hace
+    un único WriteBatch con las muestras y un Increment por agregado mensual,
+    en lugar de un set() y una transacción por muestra.
+
+    El lote es atómico, así que muestras y agregados quedan consistentes. Las
+    muestras agregadas con replace=True pueden existir ya (reanudación de un
+    trabajo): se leen todas con un get_all y su versión anterior se resta.
+    Los agregados de meses que todavía no existen se crean primero desde las
+    muestras (ensure_aggregates) para que los Increment no dejen uno parcial.
+    """
+
+    def __init__(self, db, batch_size=None):
+        self.db = db
+        self.batch_size = batch_size or int(os.getenv("SAMPLE_WRITE_BATCH", 200))
+        self._lock = threading.Lock()
+        self._pending = []
+        self.samples = 0
+        self.writes = 0
+        self.commits = 0
+        self._commit_seconds = 0.0
+        self._started = None
+        self._finished = None
+
+    def add(self, sample_ref, sample_data, replace=False):
+        """Encola una muestra; hace flush() al llegar a batch_size."""
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            self._pending.append((sample_ref, sample_data, replace))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        # Las muestras y sus agregados deben entrar en un mismo lote de MAX_BATCH_WRITES
+        while pending:
+            self._commit(pending[:MAX_BATCH_WRITES // 2])
+            pending = pending[MAX_BATCH_WRITES // 2:]
+
+    def stats(self):
+        """
+        Muestras y escrituras confirmadas. writes_per_second es el ritmo logrado
+        entre la primera muestra y el último commit; commit_ms la latencia media.
+        """
+        with self._lock:
+            elapsed = (self._finished - self._started) if self._finished else 0.0
+            return {
+                "samples": self.samples,
+                "writes": self.writes,
+                "commits": self.commits,
+                "writes_per_second": round(self.writes / elapsed, 1) if elapsed else 0.0,
+                "commit_ms": round(1000 * self._commit_seconds / self.commits, 1) if self.commits else 0.0
+            }
+
+    def _commit(self, items):
+        deltas = {}
+
+        def delta(sample):
+            key = (sample["user_id"], sample_month(sample))
+            return deltas.setdefault(key, empty_aggregate(*key))
+
+        replaced = [ref for ref, _, replace in items if replace]
+        if replaced:
+            for snapshot in self.db.get_all(replaced):
+                if snapshot.exists:
+                    previous = snapshot.to_dict()
+                    apply_sample(delta(previous), previous, sign=-1, prune=False)
+
+        for _, data, _ in items:
+            apply_sample(delta(data), data, prune=False)
+        ensure_aggregates(self.db, deltas.keys())
+
+        batch = self.db.batch()
+        for ref, data, _ in items:
+            batch.set(ref, data)
+        for (user_id, month), aggregate in deltas.items():
+            batch.set(aggregate_ref(self.db, user_id, month), aggregate_increments(aggregate), merge=True)
+
+        start = time.perf_counter()
+        batch.commit()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples += len(items)
+            self.writes += len(items) + len(deltas)
+            self.commits += 1
+            self._commit_seconds += elapsed
+            self._finished = time.monotonic()
+
+
+class ThrottledUpdater:
+    """
+    Coalesce actualizaciones frecuentes de un documento (p.ej. el progreso de
+    una tarea): update() guarda los campos y escribe como máximo una vez cada
+    interval segundos; flush() escribe lo pendiente.
+    """
+
+    def __init__(self, ref, interval=None):
+        self.ref = ref
+        self.interval = interval if interval is not None else float(os.getenv("PROGRESS_UPDATE_INTERVAL", 2.0))
+        self._lock = threading.Lock()
+        self._fields = {}
+        self._last = 0.0
+        self.writes = 0
+
+    def update(self, fields):
+        with self._lock:
+            self._fields.update(fields)
+            if time.monotonic() - self._last < self.interval:
+                return
+        self.flush()
+
+    def flush(self, fields=None):
+        with self._lock:
+            if fields:
+                self._fields.update(fields)
+            pending, self._fields = self._fields, {}
+            self._last = time.monotonic()
+        if pending:
+            self.ref.update(pending)
+            with self._lock:
+                self.writes += 1
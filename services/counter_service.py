@@ -3,111 +3,475 @@ import numpy as np
 import io
 import os
 import base64
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from typing import Tuple, List
+from utils.cache import LRUCache
 
-def process_sample_image(image_bytes, sectors=1, sensitivity=50):
+RENDER_MODES = ("counts", "overview", "full")
+
+# Formatos de codificación soportados -> (extensión OpenCV, mimetype)
+IMAGE_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "jpg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+# Decodificación reducida de JPEG, de mayor a menor reducción
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+class CounterPipeline:
+    """
+    Pipeline de conteo reutilizable para un conjunto fijo de parámetros.
+
+    Mantiene precalculados el kernel de morfología y los umbrales por
+    sensibilidad, y por hilo el objeto CLAHE y los buffers de trabajo, que se
+    reutilizan mientras las imágenes tengan el mismo tamaño.
+    Obtener instancias con get_pipeline() para compartirlas entre llamadas.
+    """
+
+    def __init__(self, clip_limit=2.0, tile_grid=(8, 8), blur_ksize=5, morph_ksize=3,
+                 min_area=None, max_area=None, max_width=800, reduced_decode=None):
+        self.clip_limit = clip_limit
+        self.tile_grid = tuple(tile_grid)
+        self.blur_ksize = (blur_ksize, blur_ksize)
+        # Límites exclusivos de área (en píxeles) de un blob válido
+        self.min_area = min_area if min_area is not None else int(os.getenv("COUNTER_MIN_AREA", 2))
+        self.max_area = max_area if max_area is not None else int(os.getenv("COUNTER_MAX_AREA", 1000))
+        self.max_width = max_width
+        if reduced_decode is None:
+            reduced_decode = os.getenv("COUNTER_REDUCED_DECODE", "1").lower() not in ("0", "false", "no")
+        self.reduced_decode = reduced_decode
+        self.kernel = np.ones((morph_ksize, morph_ksize), np.uint8)
+        self._thresholds = {}
+        self._local = threading.local()
+        # Etapa previa al umbral (imagen redimensionada y desenfocada) por hash
+        # de imagen: solo el umbral y lo que sigue dependen de la sensibilidad
+        self._stages = LRUCache(
+            maxsize=int(os.getenv("COUNTER_STAGE_CACHE_SIZE", 64)),
+            max_bytes=int(os.getenv("COUNTER_STAGE_CACHE_BYTES", 128 * 1024 * 1024)),
+            sizeof=lambda stage: stage[0].nbytes + stage[1].nbytes
+        )
+
+    @property
+    def clahe(self):
+        """Objeto CLAHE del hilo actual (OpenCV no los permite compartir entre hilos)."""
+        clahe = getattr(self._local, "clahe", None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=self.tile_grid)
+            self._local.clahe = clahe
+        return clahe
+
+    def threshold_value(self, sensitivity):
+        """Umbral de binarización para una sensibilidad (0-100)."""
+        value = self._thresholds.get(sensitivity)
+        if value is None:
+            value = 255 - int((sensitivity / 100) * 150 + 20)
+            self._thresholds[sensitivity] = value
+        return value
+
+    def process(self, image_bytes, sectors=1, sensitivity=50, render="full", encoding=None, tiled=False,
+                min_area=None, max_area=None):
+        """Ver process_sample_image."""
+        if render not in RENDER_MODES:
+            raise ValueError(f"Modo de render no soportado: {render}")
+
+        img, points, draw_points, (count_h, count_w) = self._locate(image_bytes, sensitivity, tiled, min_area, max_area)
+        
+        total_count = len(points)
+        h, w = img.shape[:2]
+        rows, cols = _grid_shape(sectors)
+        cell_counts = _bin_points(points, rows, cols, count_h, count_w)
+        
+        annotated = _annotate_points(img, draw_points) if render == "full" else None
+        
+        sector_results = []
+        for idx in range(sectors):
+            sector = {
+                "sector": idx + 1,
+                "count": int(cell_counts[idx])
+            }
+            if annotated is not None:
+                x_start, y_start, x_end, y_end = _sector_bounds(idx, rows, cols, h, w)
+                sector["image_b64"] = imageToBase64(annotated[y_start:y_end, x_start:x_end], encoding)
+            sector_results.append(sector)
+                
+        counts = [s["count"] for s in sector_results]
+        
+        # Imagen visual general con grilla y números
+        processed_image_b64 = None
+        if render != "counts":
+            vis_img = visualizeQuarter(img, (rows, cols), counts)
+            processed_image_b64 = imageToBase64(vis_img, encoding)
+        
+        return {
+            "total": total_count,
+            "points": points,
+            "processed_image_b64": processed_image_b64,
+            "sectors_data": sector_results,
+            "stats": {
+                "mean": float(np.mean(counts)) if counts else 0.0,
+                "max": int(np.max(counts)) if counts else 0,
+                "min": int(np.min(counts)) if counts else 0
+            },
+            "grid": {"rows": rows, "cols": cols},
+            # Resolución en la que están expresados los puntos
+            "resolution": {"width": count_w, "height": count_h}
+        }
+
+    def render_sector(self, image_bytes, sector, sectors=1, sensitivity=50, encoding=None, tiled=False,
+                      min_area=None, max_area=None):
+        """Ver render_sector_image."""
+        if not 1 <= sector <= sectors:
+            raise ValueError(f"Sector fuera de rango: {sector}")
+
+        img, points, draw_points, (count_h, count_w) = self._locate(image_bytes, sensitivity, tiled, min_area, max_area)
+        h, w = img.shape[:2]
+        rows, cols = _grid_shape(sectors)
+        cell_counts = _bin_points(points, rows, cols, count_h, count_w)
+
+        x_start, y_start, x_end, y_end = _sector_bounds(sector - 1, rows, cols, h, w)
+        # Solo se dibujan los puntos cuyo círculo alcanza el recorte
+        margin = 7
+        local_points = [
+            p for p in draw_points
+            if x_start - margin <= p[0] < x_end + margin and y_start - margin <= p[1] < y_end + margin
+        ]
+        crop = _annotate_points(img, local_points)[y_start:y_end, x_start:x_end]
+        data, mimetype = encodeImage(crop, encoding)
+
+        return {
+            "sector": sector,
+            "count": int(cell_counts[sector - 1]),
+            "image_b64": base64.b64encode(data).decode('utf-8'),
+            "mimetype": mimetype
+        }
+
+    def sweep(self, image_bytes, sensitivities, sectors=1, min_area=None, max_area=None):
+        """Ver sweep_sample_image."""
+        img, blurred = self.prepare(image_bytes)
+        h, w = img.shape[:2]
+        rows, cols = _grid_shape(sectors)
+
+        results = []
+        for sensitivity in sensitivities:
+            points = self.detect(blurred, sensitivity, min_area, max_area)
+            cell_counts = _bin_points(points, rows, cols, h, w)
+            results.append({
+                "sensitivity": sensitivity,
+                "total": len(points),
+                "sectors": [int(c) for c in cell_counts[:sectors]]
+            })
+        return {"grid": {"rows": rows, "cols": cols}, "results": results}
+
+    def _locate(self, image_bytes, sensitivity, tiled, min_area=None, max_area=None):
+        """
+        Devuelve (img, points, draw_points, (alto, ancho)): la imagen reducida
+        para dibujar, los puntos en la resolución de conteo, los mismos puntos
+        escalados a img y el tamaño sobre el que se cuentan los sectores.
+        """
+        img, blurred = self.prepare(image_bytes)
+        h, w = img.shape[:2]
+        if not tiled:
+            points = self.detect(blurred, sensitivity, min_area, max_area)
+            return img, points, points, (h, w)
+
+        points, (full_w, full_h) = self.detect_tiled(image_bytes, sensitivity, min_area=min_area, max_area=max_area)
+        sx, sy = w / full_w, h / full_h
+        draw_points = [(int(x * sx), int(y * sy)) for x, y in points]
+        return img, points, draw_points, (full_h, full_w)
+
+    def detect_tiled(self, image_bytes, sensitivity, tile_size=None, workers=None, min_area=None, max_area=None):
+        """
+        Detecta los puntos a resolución nativa procesando la imagen en mosaicos
+        solapados, en paralelo (OpenCV libera el GIL). Devuelve (points, (ancho, alto))
+        con los puntos en coordenadas de la imagen original.
+
+        Cada mosaico se extiende 'overlap' píxeles por lado y solo conserva los
+        puntos cuyo centroide cae en su zona propia; como overlap supera el
+        diámetro máximo de una colonia, cada colonia se ve completa en el
+        mosaico dueño de su centroide y se cuenta exactamente una vez. Se
+        descartan además los blobs cortados por un borde interior, que solo
+        pueden ser fragmentos de algo más grande.
+
+        La única matriz a tamaño completo es el plano en escala de grises
+        decodificado; los buffers de trabajo son por mosaico, así que la memoria
+        extra queda acotada por tile_size y workers.
+        """
+        tile_size = tile_size or int(os.getenv("COUNTER_TILE_SIZE", 1024))
+        workers = workers or int(os.getenv("COUNTER_TILE_WORKERS", os.cpu_count() or 1))
+
+        gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("No se pudo decodificar la imagen.")
+        full_h, full_w = gray.shape
+
+        # Los parámetros están pensados para max_width; a resolución nativa las
+        # colonias y las celdas de CLAHE son 'scale' veces más grandes
+        scale = max(1.0, full_w / self.max_width)
+        min_area, max_area = self.area_bounds(min_area, max_area)
+        # Ambos límites se expresan en píxeles a max_width, como en detect
+        min_area, max_area = min_area * scale * scale, max_area * scale * scale
+        overlap = int(np.ceil(2 * np.sqrt(max_area / np.pi))) + self.blur_ksize[0] + self.kernel.shape[0]
+        clahe_cell = max(8, int(round(scale * self.max_width / self.tile_grid[0])))
+        threshold_value = self.threshold_value(sensitivity)
+
+        def detect_tile(origin):
+            x0, y0 = origin
+            x1, y1 = min(x0 + tile_size, full_w), min(y0 + tile_size, full_h)
+            px0, py0 = max(0, x0 - overlap), max(0, y0 - overlap)
+            px1, py1 = min(full_w, x1 + overlap), min(full_h, y1 + overlap)
+            region = gray[py0:py1, px0:px1]
+            ph, pw = region.shape
+
+            grid = (max(1, round(pw / clahe_cell)), max(1, round(ph / clahe_cell)))
+            contrast = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=grid).apply(region)
+            blurred = cv2.GaussianBlur(contrast, self.blur_ksize, 0)
+            _, thresh = cv2.threshold(blurred, threshold_value, 255, cv2.THRESH_BINARY_INV)
+            thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, self.kernel, iterations=1)
+            _, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(thresh, 8, cv2.CV_32S, cv2.CCL_GRANA)
+
+            stats, centroids = stats[1:], centroids[1:]
+            areas = stats[:, cv2.CC_STAT_AREA]
+            left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+            right = left + stats[:, cv2.CC_STAT_WIDTH]
+            bottom = top + stats[:, cv2.CC_STAT_HEIGHT]
+            # Blobs cortados por un borde interior del mosaico ampliado
+            cut = ((left == 0) & (px0 > 0)) | ((top == 0) & (py0 > 0)) | \
+                ((right >= pw) & (px1 < full_w)) | ((bottom >= ph) & (py1 < full_h))
+            pts = centroids.astype(np.int64) + (px0, py0)
+            owned = (pts[:, 0] >= x0) & (pts[:, 0] < x1) & (pts[:, 1] >= y0) & (pts[:, 1] < y1)
+            keep = (areas > min_area) & (areas < max_area) & ~cut & owned
+            return [tuple(p) for p in pts[keep].tolist()]
+
+        origins = [(x0, y0) for y0 in range(0, full_h, tile_size) for x0 in range(0, full_w, tile_size)]
+        points = []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(origins)))) as pool:
+            for found in pool.map(detect_tile, origins):
+                points.extend(found)
+        return points, (full_w, full_h)
+
+    def prepare(self, image_bytes):
+        """
+        Devuelve (img, blurred) para la imagen, reutilizando la caché si ya se
+        procesó. Ambos arrays son de solo lectura porque se comparten.
+        """
+        key = hashlib.sha256(image_bytes).hexdigest()
+        stage = self._stages.get(key)
+        if stage is None:
+            img = self.load(image_bytes)
+            blurred = self.preprocess(img).copy()
+            img.flags.writeable = False
+            blurred.flags.writeable = False
+            stage = (img, blurred)
+            self._stages.set(key, stage)
+        return stage
+
+    def clear_cache(self):
+        """Vacía la caché de etapas (imagen reducida y desenfocada)."""
+        self._stages.clear()
+
+    def load(self, image_bytes):
+        """Decodifica los bytes y limita el ancho de la imagen a max_width."""
+        # Convertir bytes a imagen OpenCV
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        flags = self._decode_flags(image_bytes) if self.reduced_decode else cv2.IMREAD_COLOR
+        img = cv2.imdecode(nparr, flags)
+        
+        if img is None:
+            raise ValueError("No se pudo decodificar la imagen.")
+
+        # Forzado de ancho máximo manteniendo la proporción
+        if img.shape[1] > self.max_width:
+            ratio = self.max_width / float(img.shape[1])
+            dim = (self.max_width, int(img.shape[0] * ratio))
+            img = cv2.resize(img, dim, interpolation=cv2.INTER_AREA)
+        return img
+
+    def _decode_flags(self, image_bytes):
+        """
+        Lee solo la cabecera de la imagen y elige la decodificación reducida
+        (1/2, 1/4 u 1/8, escalado DCT de libjpeg) que queda justo por encima de
+        max_width. Solo aplica a JPEG: en otros formatos OpenCV decodifica
+        completo y luego reduce, sin ahorro.
+        """
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as header:
+                if header.format != "JPEG":
+                    return cv2.IMREAD_COLOR
+                width, height = header.size
+                # imdecode aplica la orientación EXIF; con 5-8 el ancho final es el alto
+                if header.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                    width = height
+        except Exception:
+            return cv2.IMREAD_COLOR
+
+        for factor, flags in REDUCED_DECODE_FLAGS:
+            if width // factor >= self.max_width:
+                return flags
+        return cv2.IMREAD_COLOR
+
+    def preprocess(self, img):
+        """
+        Escala de grises, CLAHE y desenfoque gaussiano.
+        El resultado vive en un buffer del hilo: copiarlo si debe sobrevivir
+        a la siguiente llamada.
+        """
+        shape = img.shape[:2]
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._buffer("gray", shape))
+        contrast = self.clahe.apply(gray, dst=self._buffer("contrast", shape))
+        return cv2.GaussianBlur(contrast, self.blur_ksize, 0, dst=self._buffer("blurred", shape))
+
+    def binarize(self, blurred, sensitivity):
+        """Umbral inverso y apertura morfológica: los puntos oscuros quedan en 255."""
+        shape = blurred.shape
+        # Umbralizado
+        _, thresh = cv2.threshold(
+            blurred, self.threshold_value(sensitivity), 255, cv2.THRESH_BINARY_INV,
+            dst=self._buffer("thresh", shape)
+        )
+        
+        # Morfología
+        return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, self.kernel, iterations=1, dst=self._buffer("opened", shape))
+
+    def area_bounds(self, min_area=None, max_area=None):
+        """Límites de área del request, o los de la instancia si no se indican."""
+        return (self.min_area if min_area is None else min_area,
+                self.max_area if max_area is None else max_area)
+
+    def detect(self, blurred, sensitivity, min_area=None, max_area=None):
+        """
+        Devuelve los centroides (x, y) de los puntos oscuros detectados.
+        min_area/max_area reemplazan para esta llamada los límites de la instancia.
+        """
+        min_area, max_area = self.area_bounds(min_area, max_area)
+        thresh = self.binarize(blurred, sensitivity)
+        
+        # Componentes conexas (8-vecinos) con área y centroide en una sola pasada.
+        # BBDT (Grana) resultó bastante más rápido que el algoritmo por defecto
+        _, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+            thresh, 8, cv2.CV_32S, cv2.CCL_GRANA, labels=self._buffer("labels", thresh.shape, np.int32)
+        )
+        # La fila 0 es el fondo
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        keep = (areas > min_area) & (areas < max_area)
+        # astype trunca igual que el int() del cálculo por momentos anterior
+        return [tuple(p) for p in centroids[1:][keep].astype(np.int64).tolist()]
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """Buffer de trabajo del hilo actual, reasignado solo si cambia el tamaño."""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = buffers[name] = np.empty(shape, dtype)
+        return buf
+
+_thread_policy_pid = None
+
+def apply_opencv_thread_policy():
+    """
+    Fija cv2.setNumThreads una vez por proceso según COUNTER_CV_THREADS.
+    Por defecto 1: el paralelismo lo ponen los workers de gunicorn y el pool
+    del contador, y los hilos internos de OpenCV solo compiten por los núcleos.
+    Un valor negativo deja la configuración por defecto de OpenCV.
+    """
+    global _thread_policy_pid
+    if _thread_policy_pid == os.getpid():
+        return
+    threads = int(os.getenv("COUNTER_CV_THREADS", 1))
+    if threads >= 0:
+        cv2.setNumThreads(threads)
+    _thread_policy_pid = os.getpid()
+
+@lru_cache(maxsize=16)
+def get_pipeline(**params):
+    """Devuelve la instancia de CounterPipeline compartida para esos parámetros."""
+    apply_opencv_thread_policy()
+    return CounterPipeline(**params)
+
+def process_sample_image(image_bytes, sectors=1, sensitivity=50, render="full", encoding=None, tiled=False,
+                         min_area=None, max_area=None):
     """
     Procesa una imagen para contar puntos oscuros (larvas/colonias) en cuadrantes.
+
+    render controla qué imágenes se codifican:
+      - "counts": solo conteos y coordenadas, sin imágenes.
+      - "overview": solo la imagen general con la grilla.
+      - "full": imagen general y un recorte anotado por sector.
+
+    Con tiled=True el conteo se hace a resolución nativa por mosaicos (ver
+    CounterPipeline.detect_tiled) y los puntos quedan en coordenadas de la
+    imagen original; las imágenes generadas siguen siendo de 800px.
+
+    min_area/max_area fijan los límites exclusivos de área (en píxeles) de un
+    blob; por defecto COUNTER_MIN_AREA y COUNTER_MAX_AREA.
+    """
+    return get_pipeline().process(image_bytes, sectors=sectors, sensitivity=sensitivity, render=render, encoding=encoding,
+                                  tiled=tiled, min_area=min_area, max_area=max_area)
+
+def render_sector_image(image_bytes, sector, sectors=1, sensitivity=50, encoding=None, tiled=False,
+                        min_area=None, max_area=None):
+    """
+    Genera bajo demanda el recorte anotado de un solo sector (1-indexado).
+    """
+    return get_pipeline().render_sector(image_bytes, sector, sectors=sectors, sensitivity=sensitivity, encoding=encoding,
+                                        tiled=tiled, min_area=min_area, max_area=max_area)
+
+def sweep_sample_image(image_bytes, sensitivities, sectors=1, min_area=None, max_area=None):
+    """
+    Cuenta la misma imagen con varias sensibilidades. La decodificación,
+    CLAHE y desenfoque se hacen una sola vez (y quedan en caché).
+    """
+    return get_pipeline().sweep(image_bytes, sensitivities, sectors=sectors, min_area=min_area, max_area=max_area)
+
+def _grid_shape(sectors):
+    """
+    Calcula la grilla (filas, columnas) para el número de sectores.
+    Si sectors=4 -> 2x2. Si sectors=1 -> 1x1. Si sectors=9 -> 3x3.
     """
-    # Convertir bytes a imagen OpenCV
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
-    if img is None:
-        raise ValueError("No se pudo decodificar la imagen.")
-
-    # Forzado ancho máximo de 800px manteniendo la proporción
-    max_width = 800
-    if img.shape[1] > max_width:
-        ratio = max_width / float(img.shape[1])
-        # Redimensionar la imagen a 800x800 píxeles
-        dim = (max_width, int(img.shape[0] * ratio))
-        img = cv2.resize(img, dim, interpolation=cv2.INTER_AREA)
-        #img = cv2.resize(img, (800, 800))
-
-    # Escala de grises y mejora de contraste
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    contrast = improveContrast(gray)
-    blurred = cv2.GaussianBlur(contrast, (5, 5), 0)
-    
-    # Umbralizado
-    threshold_value = 255 - int((sensitivity / 100) * 150 + 20) 
-    _, thresh = cv2.threshold(blurred, threshold_value, 255, cv2.THRESH_BINARY_INV)
-    
-    # Morfología
-    kernel = np.ones((3, 3), np.uint8)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
-    
-    # Encontrar contornos
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    points = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if 2 < area < 1000:
-            M = cv2.moments(cnt)
-            if M["m00"] != 0:
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
-                points.append((cX, cY))
-    
-    total_count = len(points)
-    h, w = gray.shape
-    
-    # 5. Análisis por sectores (Grilla NxM)
-    # Si sectors=4 -> 2x2. Si sectors=1 -> 1x1. Si sectors=9 -> 3x3.
-    # Por ahora asumimos raíces cuadradas perfectas o 1.
     cols = int(np.sqrt(sectors))
     if cols * cols < sectors:
         cols += 1
     rows = (sectors + cols - 1) // cols
-    
-    sector_results = []
+    return rows, cols
+
+def _sector_bounds(idx, rows, cols, h, w):
+    """Límites (x_start, y_start, x_end, y_end) del sector idx (0-indexado)."""
+    r, c = divmod(idx, cols)
     qh, qw = h // rows, w // cols
-    
-    for r in range(rows):
-        for c in range(cols):
-            idx = r * cols + c
-            if idx >= sectors: break
-            
-            x_start = c * qw
-            y_start = r * qh
-            x_end = (c + 1) * qw if c < cols - 1 else w
-            y_end = (r + 1) * qh if r < rows - 1 else h
-            
-            count_in_sector = sum(1 for p in points if x_start <= p[0] < x_end and y_start <= p[1] < y_end)
-            
-            # Recortar el cuadrante para la vista detallada
-            quadrant_img = img[y_start:y_end, x_start:x_end].copy()
-            # Opcional: dibujar puntos locales en el recorte
-            for p in points:
-                if x_start <= p[0] < x_end and y_start <= p[1] < y_end:
-                    cv2.circle(quadrant_img, (p[0] - x_start, p[1] - y_start), 5, (0, 0, 255), 2)
-            
-            sector_results.append({
-                "sector": idx + 1,
-                "count": count_in_sector,
-                "image_b64": imageToBase64(quadrant_img)
-            })
-            
-    counts = [s["count"] for s in sector_results]
-    
-    # Imagen visual general con grilla y números
-    vis_img = visualizeQuarter(img, (rows, cols), counts)
-    
-    return {
-        "total": total_count,
-        "points": points,
-        "processed_image_b64": imageToBase64(vis_img),
-        "sectors_data": sector_results,
-        "stats": {
-            "mean": float(np.mean(counts)) if counts else 0.0,
-            "max": int(np.max(counts)) if counts else 0,
-            "min": int(np.min(counts)) if counts else 0
-        },
-        "grid": {"rows": rows, "cols": cols}
-    }
+    x_start = c * qw
+    y_start = r * qh
+    x_end = (c + 1) * qw if c < cols - 1 else w
+    y_end = (r + 1) * qh if r < rows - 1 else h
+    return x_start, y_start, x_end, y_end
+
+def _bin_points(points, rows, cols, h, w):
+    """
+    Cuenta los puntos por celda de la grilla (orden fila por fila).
+    La última fila/columna absorbe el residuo de la división entera.
+    """
+    qh, qw = h // rows, w // cols
+    pts = np.array(points, dtype=np.int64).reshape(-1, 2)
+    col_idx = np.minimum(pts[:, 0] // qw, cols - 1) if qw else np.full(len(pts), cols - 1)
+    row_idx = np.minimum(pts[:, 1] // qh, rows - 1) if qh else np.full(len(pts), rows - 1)
+    return np.bincount(row_idx * cols + col_idx, minlength=rows * cols)
+
+def _annotate_points(img, points):
+    """Copia de la imagen con un círculo sobre cada punto detectado."""
+    annotated = img.copy()
+    for p in points:
+        cv2.circle(annotated, p, 5, (0, 0, 255), 2)
+    return annotated
 
 def get_processed_image_visual(image_bytes, points):
     """
@@ -125,15 +489,51 @@ def get_processed_image_visual(image_bytes, points):
     _, buffer = cv2.imencode('.png', img)
     return buffer.tobytes()
 
-def imageToBase64(image: np.ndarray) -> str:
+def get_encoding(fmt=None, quality=None, png_compression=None):
+    """
+    Construye la configuración de codificación de imágenes.
+    Los valores omitidos se toman de COUNTER_IMAGE_FORMAT,
+    COUNTER_IMAGE_QUALITY y COUNTER_PNG_COMPRESSION.
+    """
+    fmt = (fmt or os.getenv("COUNTER_IMAGE_FORMAT", "png")).lower()
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Formato de imagen no soportado: {fmt}")
+    quality = int(quality if quality is not None else os.getenv("COUNTER_IMAGE_QUALITY", 90))
+    if png_compression is None:
+        png_compression = os.getenv("COUNTER_PNG_COMPRESSION")
+    # None mantiene la configuración por defecto de OpenCV
+    png_compression = int(png_compression) if png_compression not in (None, "") else None
+    if not 1 <= quality <= 100:
+        raise ValueError("La calidad debe estar entre 1 y 100.")
+    if png_compression is not None and not 0 <= png_compression <= 9:
+        raise ValueError("La compresión PNG debe estar entre 0 y 9.")
+    return {"format": fmt, "quality": quality, "png_compression": png_compression}
+
+def encodeImage(image: np.ndarray, encoding=None) -> Tuple[bytes, str]:
+    """Codifica una imagen OpenCV; devuelve (bytes, mimetype)."""
+    encoding = encoding or get_encoding()
+    ext, mimetype = IMAGE_FORMATS[encoding["format"]]
+    if ext == ".png":
+        params = []
+        if encoding["png_compression"] is not None:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, encoding["png_compression"]]
+    elif ext == ".jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, encoding["quality"]]
+    else:
+        params = [cv2.IMWRITE_WEBP_QUALITY, encoding["quality"]]
+    ok, buffer = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen como {encoding['format']}.")
+    return buffer.tobytes(), mimetype
+
+def imageToBase64(image: np.ndarray, encoding=None) -> str:
     """Convierte una imagen OpenCV a string Base64."""
-    _, buffer = cv2.imencode('.png', image)
-    return base64.b64encode(buffer).decode('utf-8')
+    data, _ = encodeImage(image, encoding)
+    return base64.b64encode(data).decode('utf-8')
 
 def improveContrast(image_gray: np.ndarray) -> np.ndarray:
     """Aplica CLAHE para mejorar el contraste local."""
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    return clahe.apply(image_gray)
+    return get_pipeline().clahe.apply(image_gray)
 
 def visualizeQuarter(contrast, cuadrantes, totales):
     """Dibuja cuadrantes y sus totales en la imagen."""
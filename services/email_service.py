@@ -1,50 +1,297 @@
-import smtplib
 import os
+import re
+import ssl
+import time
+import heapq
+import queue
+import itertools
+import atexit
+import smtplib
+import threading
+from functools import lru_cache
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import ssl
 from dotenv import load_dotenv
 load_dotenv()
-from modules.core.controller import response
 
 SENDER = os.getenv("APP_SMTP_EMAIL")
 PASSWORD = os.getenv("APP_SMTP_PASS")
 SMTP_SERVER = os.getenv("APP_SMTP_HOST")
-SMTP_PORT = os.getenv("APP_SMTP_PORT")
+SMTP_PORT = int(os.getenv("APP_SMTP_PORT") or 587)
 REPLY_TO = os.getenv("APP_SMTP_REPLY_TO")
+# Sin STARTTLS ni contraseña se puede enviar a un servidor SMTP local de pruebas
+SMTP_STARTTLS = os.getenv("APP_SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
 
-# --- Función para enviar correos electrónicos ---
-def send_email(receiver_email, subject,data, template):
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+@lru_cache(maxsize=64)
+def load_template(template):
     """
-    Función para enviar un correo electrónico.
-    Utiliza SSL para una conexión segura.
+    Lee {template}.html una sola vez y lo compila en una lista de partes:
+    texto literal en las posiciones pares y nombres de variable ({{nombre}})
+    en las impares.
     """
-    if not all([SENDER, PASSWORD]):
-        return response("Faltan credenciales del servidor de correo.", None, 400)
+    with open(template + ".html", "r") as file:
+        return tuple(_PLACEHOLDER.split(file.read()))
 
+def render_template(template, data):
+    """Rellena la plantilla; las variables sin valor en data quedan como están."""
+    parts = load_template(template)
+    return "".join(
+        part if i % 2 == 0 else str(data[part]) if part in data else "{{" + part + "}}"
+        for i, part in enumerate(parts)
+    )
+
+def build_message(receiver_email, subject, body):
     message = MIMEMultipart("alternative")
     message["Subject"] = subject
     message["From"] = SENDER
     message["To"] = receiver_email
-    # get template
-    with open(template  + ".html", "r") as file:
-        template = file.read()
-    # replace data
-    for key, value in data.items():
-        template = template.replace("{{" + key + "}}", value)
-
-    # Crea la parte de texto plano del correo
-    text_part = MIMEText(template, "plain")
-    message.attach(text_part)
-
-    try:
-        # Crea una conexión SSL segura con el servidor SMTP
-        context = ssl.create_default_context()
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls(context=context)  # Inicia la encriptación TLS
-            server.login(SENDER, PASSWORD)
-            server.sendmail(SENDER, receiver_email, message.as_string())
-        return response("Correo enviado con éxito.", None, 200)
-    except Exception as e:
-        print(f"Error al enviar el correo a {receiver_email}: {e}")
-        return response(str(e), None, 500)
\ No newline at end of file
+    if REPLY_TO:
+        message["Reply-To"] = REPLY_TO
+    message.attach(MIMEText(body, "html"))
+    return message
+
+
+class Outbox:
+    """
+    Envío de correos en segundo plano. send() encola el mensaje y vuelve;
+    senders hilos lo envían, cada uno con su propia conexión SMTP persistente
+    (el pool), que se abre al primer mensaje, sirve lotes de hasta batch_size
+    mensajes y se cierra tras idle_timeout segundos sin uso.
+
+    Los errores temporales (respuestas 4xx, o desconexión, que abre una
+    conexión nueva) se reintentan con espera exponencial; los permanentes
+    (5xx, destinatario rechazado) se descartan. Un mensaje a reintentar vuelve
+    a una cola de espera con su hora de reintento y el sender sigue con el
+    resto del lote: la espera no bloquea a los demás mensajes. La cola está
+    acotada: send() devuelve False cuando está llena.
+    """
+
+    def __init__(self, host, port, sender, password=None, starttls=True, senders=2, batch_size=20,
+                 max_queue=1000, retries=3, backoff=2.0, idle_timeout=30, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        # Reintentos pendientes: (no antes de, secuencia, intento, mensaje)
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._rejected = 0
+        self._connections = 0
+        self._batches = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            SMTP_SERVER, SMTP_PORT, SENDER, PASSWORD, starttls=SMTP_STARTTLS,
+            senders=int(os.getenv("EMAIL_SENDERS", 2)),
+            batch_size=int(os.getenv("EMAIL_BATCH_SIZE", 20)),
+            max_queue=int(os.getenv("EMAIL_QUEUE_SIZE", 1000)),
+            retries=int(os.getenv("EMAIL_RETRIES", 3)),
+            backoff=float(os.getenv("EMAIL_RETRY_BACKOFF", 2.0)),
+            idle_timeout=float(os.getenv("EMAIL_IDLE_TIMEOUT", 30))
+        )
+
+    def send(self, message):
+        """Encola un mensaje (email.message.Message con To). Devuelve False si la cola está llena."""
+        try:
+            self._get_queue().put_nowait(message)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._queued += 1
+        return True
+
+    def join(self, timeout=None):
+        """Espera a que se vacíe la cola (o hasta timeout segundos). Devuelve True si terminó."""
+        q = self._queue
+        if q is None or self._pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while q.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        with self._lock:
+            q = self._queue if self._pid == os.getpid() else None
+            return {
+                "senders": self.senders,
+                "queue_size": self.max_queue,
+                "queue_depth": q.qsize() if q else 0,
+                "delayed": len(self._delayed) if q else 0,
+                "queued": self._queued,
+                "sent": self._sent,
+                "failed": self._failed,
+                "retried": self._retried,
+                "rejected": self._rejected,
+                "connections": self._connections,
+                "batches": self._batches
+            }
+
+    def _get_queue(self):
+        with self._lock:
+            # Los hilos no sobreviven a un fork: la cola y los hilos son por proceso
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._delayed = []
+                self._pid = os.getpid()
+                for i in range(self.senders):
+                    threading.Thread(
+                        target=self._run, args=(self._queue,),
+                        name=f"email-sender-{i}", daemon=True
+                    ).start()
+            return self._queue
+
+    def _run(self, q):
+        # Conexión de este hilo; _deliver la reemplaza al reconectar
+        conn = [None]
+        last_used = time.monotonic()
+        while True:
+            batch = self._due(self.batch_size)
+            if not batch:
+                try:
+                    batch = [(0, q.get(timeout=self._wait(conn[0], last_used)))]
+                except queue.Empty:
+                    if conn[0] and time.monotonic() - last_used >= self.idle_timeout:
+                        conn[0] = self._close(conn[0])
+                    continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append((0, q.get_nowait()))
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._batches += 1
+            for attempt, message in batch:
+                try:
+                    self._deliver(conn, message)
+                    with self._lock:
+                        self._sent += 1
+                except Exception as e:
+                    if attempt < self.retries and _is_temporary(e):
+                        # Sigue pendiente en la cola (sin task_done) hasta el reintento
+                        self._retry_later(attempt, message)
+                        continue
+                    with self._lock:
+                        self._failed += 1
+                    print(f"Error al enviar el correo a {message['To']}: {e}")
+                q.task_done()
+            last_used = time.monotonic()
+
+    def _due(self, limit):
+        """Saca hasta limit reintentos cuya hora ya llegó, como pares (intento, mensaje)."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._delayed and self._delayed[0][0] <= now and len(due) < limit:
+                _, _, attempt, message = heapq.heappop(self._delayed)
+                due.append((attempt, message))
+        return due
+
+    def _wait(self, conn, last_used):
+        """Segundos a esperar en la cola: hasta el próximo reintento o el cierre por inactividad."""
+        waits = []
+        if conn is not None:
+            waits.append(last_used + self.idle_timeout)
+        with self._lock:
+            if self._delayed:
+                waits.append(self._delayed[0][0])
+        return max(0.0, min(waits) - time.monotonic()) if waits else None
+
+    def _retry_later(self, attempt, message):
+        not_before = time.monotonic() + self.backoff * 2 ** attempt
+        with self._lock:
+            heapq.heappush(self._delayed, (not_before, next(self._sequence), attempt + 1, message))
+            self._retried += 1
+
+    def _deliver(self, conn, message):
+        """Un intento de envío por conn[0]; tras una desconexión la descarta para reconectar."""
+        try:
+            if conn[0] is None:
+                conn[0] = self._connect()
+            conn[0].send_message(message, from_addr=self.sender)
+        except smtplib.SMTPResponseException:
+            raise
+        except (smtplib.SMTPException, OSError):
+            conn[0] = self._close(conn[0])
+            raise
+
+    def _connect(self):
+        if not self.host or not self.sender:
+            raise RuntimeError("Faltan los datos del servidor de correo.")
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+            if self.password:
+                server.login(self.sender, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        with self._lock:
+            self._connections += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return None
+
+
+def _is_temporary(error):
+    """Errores que vale la pena reintentar: respuestas 4xx y fallas de conexión."""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPAuthenticationError)):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    """Outbox compartido por el proceso, creado en el primer uso."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox.from_env()
+            atexit.register(_outbox.join, float(os.getenv("EMAIL_DRAIN_TIMEOUT", 10)))
+        return _outbox
+
+# --- Función para enviar correos electrónicos ---
+def send_email(receiver_email, subject, data, template):
+    """
+    Renderiza la plantilla {template}.html con data y encola el correo para
+    el envío en segundo plano (ver Outbox). Devuelve False si no se pudo
+    encolar.
+    """
+    message = build_message(receiver_email, subject, render_template(template, data))
+    return get_outbox().send(message)
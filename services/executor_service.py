@@ -0,0 +1,186 @@
+import os
+import math
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class QueueFullError(Exception):
+    """La cola de admisión del pool está llena."""
+
+    def __init__(self, retry_after):
+        super().__init__("Counter queue is full")
+        self.retry_after = retry_after
+
+
+class CounterTimeoutError(Exception):
+    """La tarea no terminó en timeout segundos (sigue ocupando su lugar hasta terminar)."""
+
+    def __init__(self, timeout):
+        super().__init__(f"Counter task timed out after {timeout:g}s")
+        self.timeout = timeout
+
+
+def _timed_call(fn, submitted_at, args, kwargs):
+    """Se ejecuta en el proceso hijo; devuelve cuándo empezó la tarea y su resultado."""
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+
+class CounterExecutor:
+    """
+    Pool de procesos para el trabajo de OpenCV, con una cola de admisión acotada.
+
+    Como máximo max_workers tareas corren a la vez y max_queue esperan; cualquier
+    envío adicional se rechaza con QueueFullError en lugar de acumular latencia.
+    Con max_workers=0 las tareas se ejecutan en el hilo que llama (sin pool).
+    """
+
+    def __init__(self, max_workers, max_queue, start_method="spawn", timeout=60):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.start_method = start_method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue) if max_workers else None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._waits = deque(maxlen=1000)
+        self._durations = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_workers=int(os.getenv("COUNTER_WORKERS", os.cpu_count() or 1)),
+            max_queue=int(os.getenv("COUNTER_QUEUE_SIZE", 2 * (os.cpu_count() or 1))),
+            start_method=os.getenv("COUNTER_MP_START_METHOD", "spawn"),
+            timeout=float(os.getenv("COUNTER_TASK_TIMEOUT", 60))
+        )
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) en el pool y espera su resultado.
+        Lanza QueueFullError si no hay lugar en la cola y CounterTimeoutError
+        si no termina en timeout segundos.
+        """
+        if not self.max_workers:
+            return fn(*args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        submitted_at = time.time()
+        try:
+            try:
+                future = self._get_pool().submit(_timed_call, fn, submitted_at, args, kwargs)
+            except BrokenProcessPool:
+                # Un hijo murió (p.ej. OOM); se recrea el pool y se reintenta una vez
+                self.shutdown()
+                future = self._get_pool().submit(_timed_call, fn, submitted_at, args, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+        # El lugar se libera cuando la tarea termina, aunque quien llama deje de esperar
+        future.add_done_callback(lambda f: self._on_done(f, submitted_at))
+
+        try:
+            _, result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise CounterTimeoutError(self.timeout)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+        return result
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere un lugar en la cola."""
+        with self._lock:
+            pending = self._pending
+            avg = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        waves = max(1, math.ceil((pending - self.max_workers + 1) / max(1, self.max_workers)))
+        return max(1, math.ceil(waves * avg))
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            pending = self._pending
+            return {
+                "workers": self.max_workers,
+                "queue_size": self.max_queue,
+                "running": min(pending, self.max_workers),
+                "queue_depth": max(0, pending - self.max_workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "wait_ms": {
+                    "avg": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                    "p50": round(1000 * waits[len(waits) // 2], 2) if waits else 0.0,
+                    "p95": round(1000 * waits[int(len(waits) * 0.95)], 2) if waits else 0.0,
+                    "max": round(1000 * waits[-1], 2) if waits else 0.0
+                }
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self):
+        with self._lock:
+            # Tras un fork (p.ej. gunicorn preload) el pool del padre no sirve en el hijo
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _on_done(self, future, submitted_at):
+        finished_at = time.time()
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                started_at, _ = future.result()
+                self._completed += 1
+                self._waits.append(max(0.0, started_at - submitted_at))
+                self._durations.append(finished_at - started_at)
+        self._slots.release()
+
+
+_counter_executor = None
+_executor_lock = threading.Lock()
+
+def get_counter_executor():
+    """Pool del contador compartido por el proceso, creado en el primer uso."""
+    global _counter_executor
+    with _executor_lock:
+        if _counter_executor is None:
+            _counter_executor = CounterExecutor.from_env()
+        return _counter_executor
+
+def run_counter(fn, *args, **kwargs):
+    """Atajo para ejecutar una función del contador en el pool compartido."""
+    return get_counter_executor().run(fn, *args, **kwargs)
@@ -0,0 +1,112 @@
+import io
+import csv
+from utils.firestore_utils import iter_documents
+from middlewares.json_provider import encode_json
+
+# Campos que no se exportan (imágenes)
+EXCLUDED_FIELDS = {"processed_image_b64"}
+
+# Columnas del CSV (y de los reportes); los campos anidados se aplanan con
+# notación de puntos. El CSV se escribe en streaming, así que la cabecera es
+# fija: los campos de la muestra que no están en esta lista no se exportan en
+# CSV (JSON y NDJSON devuelven los documentos completos). Ver README.
+EXPORT_COLUMNS = [
+    "id", "name", "date", "time", "crop_type", "crop_state", "status", "created_at",
+    "results.total_colonies", "results.stats.mean", "results.stats.max", "results.stats.min",
+    "results.grid.rows", "results.grid.cols", "results.sectors",
+    "edited_total_colonies", "edited_mean", "edited_max",
+    "params.sectors", "params.sensitivity", "params.render", "params.tiled",
+    "params.min_area", "params.max_area",
+    "notes", "original_image_url", "processed_image_url"
+]
+
+def flatten_sample(data):
+    """
+    Aplana un documento de muestra: los diccionarios anidados pasan a claves
+    'a.b.c' y results.sectors a los conteos por sector separados por ';'.
+    """
+    row = {}
+
+    def walk(value, prefix):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(item, f"{prefix}.{key}" if prefix else key)
+        elif prefix == "results.sectors" and isinstance(value, list):
+            row[prefix] = ";".join(str(s.get("count", "")) for s in value if isinstance(s, dict))
+        elif prefix not in EXCLUDED_FIELDS:
+            row[prefix] = value
+
+    walk(data, "")
+    return row
+
+def iter_samples(query, page_size=200, flatten=True):
+    """
+    Documentos de la consulta, leídos página a página. Con flatten=True
+    (CSV y reportes) se aplanan con flatten_sample e incluyen el id; si no, se
+    devuelven tal como están en Firestore.
+    """
+    for doc in iter_documents(query, page_size=page_size):
+        if flatten:
+            yield flatten_sample({**doc.to_dict(), "id": doc.id})
+        else:
+            yield doc.to_dict()
+
+def _stream_failed(error):
+    """
+    Registra un error a mitad de la respuesta: el status 200 ya se envió, así
+    que cada formato termina con un marcador de error reconocible.
+    """
+    print(f"Error streaming export: {error}")
+    return f"Export failed: {error}"
+
+def iter_csv(rows, columns=EXPORT_COLUMNS):
+    """
+    Genera el CSV fila por fila (la cabecera primero). Si falla a mitad, la
+    última línea es '#ERROR: <mensaje>'.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    try:
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    except Exception as e:
+        buffer.write(f"#ERROR: {_stream_failed(e)}\r\n")
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_ndjson(rows):
+    """
+    Un objeto JSON por línea, codificado con el proveedor JSON de la app. Si
+    falla a mitad, la última línea es {"status": "error", "message": ...}.
+    """
+    try:
+        for row in rows:
+            yield encode_json(row) + b"\n"
+    except Exception as e:
+        yield encode_json({"status": "error", "message": _stream_failed(e)}) + b"\n"
+
+def iter_json(rows):
+    """
+    El mismo sobre que success() ({"status", "data"}), escrito elemento a
+    elemento. Si falla a mitad, data queda con lo enviado y el sobre se cierra
+    con "error": <mensaje>.
+    """
+    yield b'{"status":"success","data":['
+    try:
+        for i, row in enumerate(rows):
+            yield (b"," if i else b"") + encode_json(row)
+    except Exception as e:
+        yield b'],"error":' + encode_json(_stream_failed(e)) + b"}"
+        return
+    yield b"]}"
+
+# formato -> (writer, mimetype, nombre de archivo, filas aplanadas)
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv", "export.csv", True),
+    "ndjson": (iter_ndjson, "application/x-ndjson", "export.ndjson", False),
+    "json": (iter_json, "application/json", None, False)
+}
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+
+class JobQueue:
+    """
+    Cola de trabajos durable sobre SQLite, compartida por la API (que encola)
+    y los workers (flask --app main massive-worker) de la misma máquina.
+
+    Un worker toma un trabajo con un lease de lease_seconds que renueva con
+    heartbeat(); si el proceso muere el lease vence y otro worker lo retoma
+    desde el último checkpoint. Un trabajo que falla max_attempts veces queda
+    en 'failed' y se entrega a on_exhausted de claim() para que quien lo
+    encoló registre el fallo.
+    """
+
+    def __init__(self, path, lease_seconds=120, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    checkpoint TEXT,
+                    worker TEXT,
+                    lease_until REAL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3"),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", 120)),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+        )
+
+    def enqueue(self, job_id, kind, payload):
+        """Agrega un trabajo; encolar dos veces el mismo id no lo duplica."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now)
+            )
+
+    def claim(self, kinds=None, on_exhausted=None):
+        """
+        Toma el trabajo más antiguo en cola o con el lease vencido.
+        Devuelve {"id", "kind", "payload", "checkpoint", "attempts"} o None.
+
+        Los trabajos que ya agotaron max_attempts (su worker murió en el último
+        intento) pasan a 'failed' y, si se indica, se llama a on_exhausted con
+        el mismo dict más "error", fuera de la transacción de SQLite.
+        """
+        while True:
+            job, exhausted = self._claim(kinds)
+            if not exhausted:
+                return job
+            if on_exhausted is not None:
+                try:
+                    on_exhausted(job)
+                except Exception as e:
+                    print(f"Error reporting exhausted job {job['id']}: {e}")
+
+    def _claim(self, kinds):
+        """Devuelve (trabajo, agotado); (None, False) si no hay trabajos."""
+        now = time.time()
+        conn = self._connect()
+        # IMMEDIATE toma el lock de escritura antes de leer: dos workers no toman el mismo trabajo
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            query = ("SELECT id, kind, payload, checkpoint, attempts, error FROM jobs "
+                     "WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?))")
+            params = [now]
+            if kinds:
+                query += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params.extend(kinds)
+            row = conn.execute(query + " ORDER BY created_at LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None, False
+            job_id, kind, payload, checkpoint, attempts, error = row
+            exhausted = attempts >= self.max_attempts
+            if exhausted:
+                error = error or "Too many attempts"
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                    (error, now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                    "lease_until = ?, updated_at = ? WHERE id = ?",
+                    (self.worker_id, now + self.lease_seconds, now, job_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "checkpoint": json.loads(checkpoint) if checkpoint else None,
+            "attempts": attempts if exhausted else attempts + 1
+        }
+        if exhausted:
+            job["error"] = error
+        return job, exhausted
+
+    def checkpoint(self, job_id, checkpoint):
+        """Guarda el progreso y renueva el lease."""
+        self._update(job_id, "checkpoint = ?, lease_until = ?", (json.dumps(checkpoint), time.time() + self.lease_seconds))
+
+    def heartbeat(self, job_id):
+        self._update(job_id, "lease_until = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, job_id):
+        self._update(job_id, "status = 'done', lease_until = NULL", ())
+
+    def fail(self, job_id, error, retry=True):
+        """Libera el trabajo para reintentarlo (desde su checkpoint) o lo marca como fallido."""
+        status = 'queued' if retry else 'failed'
+        self._update(job_id, "status = ?, error = ?, lease_until = NULL", (status, str(error)))
+
+    def stats(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def _update(self, job_id, assignments, params):
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND worker = ?",
+                (*params, time.time(), job_id, self.worker_id)
+            )
+
+    def _connect(self):
+        # Una conexión por hilo; autocommit salvo en los bloques 'with' y BEGIN explícitos
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaction(conn)
+
+
+class _Transaction:
+    """Conexión que, usada con 'with', envuelve el bloque en BEGIN/COMMIT."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+    def __enter__(self):
+        self.conn.execute("BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_job_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Cola de trabajos del proceso, creada en el primer uso."""
+    global _job_queue
+    with _queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue.from_env()
+        return _job_queue
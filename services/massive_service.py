@@ -0,0 +1,367 @@
+import os
+import csv
+import time
+import uuid
+import socket
+import tempfile
+import threading
+import ipaddress
+import itertools
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from services.counter_service import process_sample_image, get_encoding
+from services.executor_service import CounterExecutor
+from services.upload_service import upload_sample_images
+from services.sample_service import build_sample, upload_job_for
+from services.batch_writer import SampleWriter, ThrottledUpdater
+from utils.firebase_config import get_db, get_bucket
+
+JOB_KIND = "massive_processing"
+
+# Columnas reconocidas (sin distinguir mayúsculas) para la URL de la imagen
+URL_COLUMNS = ("image_url", "imagen_url", "url", "image", "imagen")
+
+# Errores por fila que se guardan en la tarea (el resto solo se cuentan)
+MAX_TASK_ERRORS = 50
+
+
+class MassiveProcessor:
+    """
+    Ejecuta los trabajos de carga masiva: lee el CSV/Excel por bloques de
+    chunk_size filas, descarga cada imagen con una sesión HTTP con pool de
+    conexiones, la cuenta en un pool de procesos y guarda la muestra.
+
+    Las muestras de cada bloque se escriben en lote y después se guarda el
+    checkpoint en la cola; si el worker muere, el trabajo se retoma desde la
+    primera fila del bloque en curso. Los ids de muestra se derivan de la
+    tarea y la fila, así que reprocesar una fila reemplaza su muestra en lugar
+    de duplicarla. El progreso de la tarea se escribe como máximo cada
+    PROGRESS_UPDATE_INTERVAL segundos.
+    """
+
+    def __init__(self, queue, fetch_workers=8, counter_workers=2, chunk_size=100,
+                 fetch_timeout=30, max_image_bytes=25 * 1024 * 1024, allow_private_urls=False):
+        self.queue = queue
+        self.fetch_workers = fetch_workers
+        self.chunk_size = chunk_size
+        self.fetch_timeout = fetch_timeout
+        self.max_image_bytes = max_image_bytes
+        self.allow_private_urls = allow_private_urls
+        self.executor = CounterExecutor(max_workers=counter_workers, max_queue=fetch_workers)
+        self.session = make_session(fetch_workers, allow_private=allow_private_urls)
+
+    @classmethod
+    def from_env(cls, queue):
+        return cls(
+            queue,
+            fetch_workers=int(os.getenv("MASSIVE_FETCH_WORKERS", 8)),
+            counter_workers=int(os.getenv("MASSIVE_COUNTER_WORKERS", os.cpu_count() or 1)),
+            chunk_size=int(os.getenv("MASSIVE_CHUNK_SIZE", 100)),
+            fetch_timeout=float(os.getenv("MASSIVE_FETCH_TIMEOUT", 30)),
+            max_image_bytes=int(os.getenv("MASSIVE_MAX_IMAGE_BYTES", 25 * 1024 * 1024)),
+            allow_private_urls=os.getenv("MASSIVE_ALLOW_PRIVATE_URLS", "false").lower() in ("1", "true", "yes")
+        )
+
+    def run_forever(self, poll_interval=2.0, once=False):
+        """Procesa trabajos de la cola; con once=True termina cuando la cola queda vacía."""
+        while True:
+            job = self.queue.claim([JOB_KIND], on_exhausted=self.give_up)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        payload = job["payload"]
+        task_ref = None
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job["id"], stop), daemon=True)
+        heartbeat.start()
+        try:
+            db = get_db()
+            bucket = get_bucket()
+            if not db or not bucket:
+                raise RuntimeError("Firebase not available")
+            task_ref = db.collection('tasks').document(payload["task_id"])
+
+            with tempfile.TemporaryDirectory() as workdir:
+                path = os.path.join(workdir, f"input.{payload['extension']}")
+                bucket.blob(payload["blob_path"]).download_to_filename(path)
+                self._process_file(job, path, db, bucket, task_ref)
+
+            task_ref.update({
+                "status": "completado",
+                "completed_at": datetime.now().isoformat()
+            })
+            self.queue.complete(job["id"])
+        except Exception as e:
+            print(f"Error in massive task {payload.get('task_id')}: {e}")
+            retry = job["attempts"] < self.queue.max_attempts
+            self.queue.fail(job["id"], e, retry=retry)
+            if task_ref is not None:
+                task_ref.update({
+                    "status": "pendiente" if retry else "error",
+                    "error_message": str(e)
+                })
+        finally:
+            stop.set()
+
+    def give_up(self, job):
+        """Marca como error la tarea de un trabajo que agotó sus intentos sin terminar."""
+        db = get_db()
+        if not db:
+            raise RuntimeError("Firebase not available")
+        db.collection('tasks').document(job["payload"]["task_id"]).update({
+            "status": "error",
+            "error_message": f"Gave up after {job['attempts']} attempts: {job['error']}"
+        })
+
+    def _process_file(self, job, path, db, bucket, task_ref):
+        payload = job["payload"]
+        resumed = job["checkpoint"] is not None
+        progress = job["checkpoint"] or {"next_row": 0, "processed": 0, "failed": 0, "errors": []}
+        if "total" not in progress:
+            progress["total"] = count_rows(path, payload["extension"])
+
+        task_ref.update({
+            "status": "en progreso",
+            "total_items": progress["total"],
+            "processed_items": progress["processed"],
+            "failed_items": progress["failed"]
+        })
+
+        # Muestras en lotes y progreso de la tarea coalescido (ver batch_writer)
+        writer = SampleWriter(db)
+        updater = ThrottledUpdater(task_ref)
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            for chunk in iter_chunks(path, payload["extension"], progress["next_row"], self.chunk_size):
+                futures = {pool.submit(self._process_row, payload, bucket, *item): item[0] for item in chunk}
+                for future in as_completed(futures):
+                    sample_data, error = future.result()
+                    if error is None:
+                        # Las filas tras un checkpoint pueden haberse guardado antes de la caída
+                        writer.add(db.collection('samples').document(sample_data["id"]), sample_data, replace=resumed)
+                        progress["processed"] += 1
+                    else:
+                        progress["failed"] += 1
+                        if len(progress["errors"]) < MAX_TASK_ERRORS:
+                            progress["errors"].append({"row": futures[future] + 1, "error": error})
+                    updater.update({
+                        "processed_items": progress["processed"],
+                        "failed_items": progress["failed"]
+                    })
+
+                # El checkpoint solo avanza cuando las muestras del bloque están confirmadas
+                writer.flush()
+                resumed = False
+                progress["next_row"] = chunk[-1][0] + 1
+                self.queue.checkpoint(job["id"], progress)
+                updater.update({"errors": progress["errors"]})
+
+        writes = writer.stats()
+        print(f"Massive task {payload['task_id']}: {writes['samples']} samples, "
+              f"{writes['writes']} writes in {writes['commits']} commits, "
+              f"{writes['writes_per_second']} writes/s, {updater.writes + 1} progress updates")
+        updater.flush({"errors": progress["errors"], "write_stats": writes})
+
+    def _process_row(self, payload, bucket, index, row):
+        """Procesa una fila; devuelve (documento de la muestra, None) o (None, error)."""
+        try:
+            url = row_value(row, URL_COLUMNS)
+            if not url:
+                return None, "No image URL"
+            image_bytes, content_type = self.fetch(url)
+
+            sectors = int(row.get("sectors") or payload["sectors"])
+            sensitivity = int(row.get("sensitivity") or payload["sensitivity"])
+            encoding = get_encoding()
+            results = self.executor.run(
+                process_sample_image, image_bytes, sectors=sectors, sensitivity=sensitivity,
+                render=payload["render"], encoding=encoding
+            )
+
+            user_id = payload["user_id"]
+            sample_id = row_sample_id(payload["task_id"], index)
+            filename = os.path.basename(urlparse(url).path) or f"row_{index + 1}"
+            upload_job = upload_job_for(sample_id, user_id, filename, image_bytes, content_type, results, encoding)
+            images = upload_sample_images(bucket, upload_job)
+            return build_sample(
+                sample_id, user_id, upload_job, results, images,
+                params={
+                    "sectors": sectors,
+                    "sensitivity": sensitivity,
+                    "render": payload["render"],
+                    "tiled": False,
+                    "min_area": None,
+                    "max_area": None
+                },
+                name=row.get("name") or f"{payload['filename']} #{index + 1}",
+                crop_type=row.get("crop_type") or 'default',
+                crop_state=row.get("crop_state") or 'default',
+                notes=row.get("notes") or '',
+                task_id=payload["task_id"]
+            ), None
+        except Exception as e:
+            return None, str(e)
+
+    def fetch(self, url, max_redirects=5):
+        """Descarga una imagen (http/https, tamaño acotado). Devuelve (bytes, content_type)."""
+        for _ in range(max_redirects + 1):
+            # Cada salto de una redirección se valida antes de seguirlo
+            check_url(url, self.allow_private_urls)
+            with self.session.get(url, timeout=self.fetch_timeout, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["Location"])
+                    continue
+                response.raise_for_status()
+                chunks, size = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_image_bytes:
+                        raise ValueError("Image too large")
+                    chunks.append(chunk)
+                return b"".join(chunks), response.headers.get("Content-Type", "application/octet-stream")
+        raise ValueError("Too many redirects")
+
+    def _heartbeat(self, job_id, stop):
+        # Renueva el lease mientras el trabajo corre, aunque un bloque tarde más que el lease
+        while not stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(job_id)
+            except Exception as e:
+                print(f"Error renewing lease of job {job_id}: {e}")
+
+
+def make_session(pool_size, retries=3, allow_private=False):
+    """
+    Sesión HTTP con pool de conexiones de pool_size y reintentos con espera.
+    Salvo allow_private, cada conexión verifica la IP a la que quedó conectada
+    (ver PublicAddressAdapter).
+    """
+    session = requests.Session()
+    adapter_class = HTTPAdapter if allow_private else PublicAddressAdapter
+    adapter = adapter_class(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def check_url(url, allow_private=False):
+    """
+    Solo http/https y, salvo allow_private, hosts con IP pública (evita SSRF a
+    la red interna). Es un filtro previo: la conexión vuelve a resolver el
+    nombre, así que la IP efectiva la verifica PublicAddressAdapter.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("Invalid image URL")
+    if allow_private:
+        return
+    for info in socket.getaddrinfo(parsed.hostname, parsed.port or None):
+        check_address(info[4][0])
+
+def check_address(address):
+    if not ipaddress.ip_address(address).is_global:
+        raise ValueError("Image URL points to a private address")
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self)
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self)
+
+
+def _check_peer(conn):
+    # Antes de enviar el request: un DNS que cambia entre check_url y la conexión no llega a la red interna
+    try:
+        check_address(conn.sock.getpeername()[0])
+    except ValueError:
+        conn.close()
+        raise
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    HTTPAdapter cuyas conexiones, recién abiertas y antes de enviar nada por
+    HTTP, comprueban que la dirección del otro extremo sea pública. Cierra la
+    ventana entre la resolución de check_url y la de la conexión (DNS rebinding).
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicHTTPConnectionPool,
+            "https": _PublicHTTPSConnectionPool
+        }
+
+def row_sample_id(task_id, index):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"tasks/{task_id}/rows/{index}"))
+
+def row_value(row, names):
+    for name in names:
+        if row.get(name):
+            return row[name].strip()
+    return None
+
+def iter_rows(path, extension, start=0):
+    """Filas del archivo como dicts con las cabeceras en minúscula, desde la fila start."""
+    if extension == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = [h.strip().lower() for h in next(reader, [])]
+            for values in itertools.islice(reader, start, None):
+                yield dict(zip(header, (v.strip() for v in values)))
+    elif extension == 'xls':
+        # El formato binario antiguo no se puede leer por partes
+        import pandas as pd
+        df = pd.read_excel(path, dtype=str).fillna('')
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        for row in df.iloc[start:].to_dict('records'):
+            yield {k: v.strip() for k, v in row.items()}
+    else:
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h or '').strip().lower() for h in next(rows, ())]
+            for values in itertools.islice(rows, start, None):
+                yield dict(zip(header, ('' if v is None else str(v).strip() for v in values)))
+        finally:
+            wb.close()
+
+def iter_chunks(path, extension, start, size):
+    """Bloques de hasta size pares (índice de fila, fila) a partir de start."""
+    rows = enumerate(iter_rows(path, extension, start), start)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def count_rows(path, extension):
+    return sum(1 for _ in iter_rows(path, extension))
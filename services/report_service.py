@@ -0,0 +1,194 @@
+from datetime import datetime
+from openpyxl import Workbook
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from services.export_service import EXPORT_COLUMNS
+
+# Columnas de la tabla del PDF: (título, clave aplanada, ancho en caracteres, alineación)
+PDF_COLUMNS = [
+    ("Hora", "time", 10, "<"),
+    ("Muestra", "name", 34, "<"),
+    ("Cultivo", "crop_type", 16, "<"),
+    ("Estado", "crop_state", 16, "<"),
+    ("Sectores", "params.sectors", 9, ">"),
+    ("Total", "results.total_colonies", 10, ">"),
+]
+
+PDF_MARGIN = 50
+PDF_ROW_HEIGHT = 12
+PDF_FONT_SIZE = 8
+
+
+class DaySummary:
+    """Acumula cantidad de muestras y colonias de un día (o del mes)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.samples = 0
+        self.colonies = 0
+
+    def add(self, row):
+        self.samples += 1
+        self.colonies += _number(row.get("results.total_colonies"))
+
+    @property
+    def mean(self):
+        return self.colonies / self.samples if self.samples else 0.0
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+def _cell(value):
+    # openpyxl solo acepta escalares; las listas u objetos se guardan como texto
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def write_excel(rows, out):
+    """
+    Escribe el reporte en out con openpyxl en modo write-only: cada fila se
+    serializa al agregarla, así que la memoria no crece con la cantidad de
+    muestras. Una segunda hoja resume las muestras y colonias por día.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Reporte Mensual')
+    ws.append(EXPORT_COLUMNS)
+
+    days = {}
+    for row in rows:
+        ws.append([_cell(row.get(col)) for col in EXPORT_COLUMNS])
+        date = row.get("date")
+        days.setdefault(date, DaySummary(date)).add(row)
+
+    summary = wb.create_sheet('Resumen diario')
+    summary.append(["Fecha", "Muestras", "Total colonias", "Promedio"])
+    for date in sorted(days, key=str):
+        day = days[date]
+        summary.append([date, day.samples, day.colonies, round(day.mean, 2)])
+    wb.save(out)
+
+
+class PdfTableWriter:
+    """
+    Tabla paginada dibujada directamente en el canvas, fila por fila, con la
+    cabecera de columnas repetida en cada página. No se arma la lista de filas
+    ni el layout de una Table completa: solo las páginas ya cerradas, que se
+    guardan comprimidas hasta save().
+
+    Con una fuente monoespaciada cada fila es una sola línea de texto con las
+    columnas rellenadas a su ancho, y todo el texto de una página va en un
+    único objeto de texto: dibujar celda por celda cuesta varias veces más.
+    """
+
+    def __init__(self, out, title, subtitle):
+        self.canvas = canvas.Canvas(out, pagesize=letter, pageCompression=1)
+        self.width, self.height = letter
+        self.title = title
+        self.subtitle = subtitle
+        self.y = None
+        self._text_obj = None
+        self._font = None
+
+    def section(self, text):
+        """Encabezado de sección (p.ej. el día); se mantiene junto a su primera fila."""
+        self._ensure_space(3)
+        self.y -= 4
+        self._line(text, bold=True)
+
+    def row(self, row):
+        self._ensure_space(1)
+        self._line(_format_row(row.get(key) for _, key, _, _ in PDF_COLUMNS))
+
+    def subtotal(self, summary):
+        self._ensure_space(1)
+        self._line(
+            f"Subtotal {summary.label}: {summary.samples} muestras - "
+            f"{summary.colonies} colonias - promedio {summary.mean:.1f}",
+            bold=True
+        )
+        self.y -= 4
+
+    def save(self):
+        if self.y is None:
+            self._new_page()
+        self._end_page()
+        self.canvas.save()
+
+    def _ensure_space(self, rows):
+        if self.y is None or self.y - rows * PDF_ROW_HEIGHT < PDF_MARGIN:
+            if self.y is not None:
+                self._end_page()
+                self.canvas.showPage()
+            self._new_page()
+
+    def _new_page(self):
+        self._text_obj = self.canvas.beginText()
+        self._font = None
+        self.y = self.height - PDF_MARGIN
+        if self.canvas.getPageNumber() == 1:
+            self._set_font("Helvetica-Bold", 12)
+            self._text_obj.setTextOrigin(PDF_MARGIN, self.y)
+            self._text_obj.textOut(self.title)
+            self.y -= 18
+            self._set_font("Helvetica", 9)
+            self._text_obj.setTextOrigin(PDF_MARGIN, self.y)
+            self._text_obj.textOut(self.subtitle)
+            self.y -= 24
+        self._line(_format_row(title for title, _, _, _ in PDF_COLUMNS), bold=True)
+        self.canvas.line(PDF_MARGIN, self.y + PDF_ROW_HEIGHT - 3, self.width - PDF_MARGIN, self.y + PDF_ROW_HEIGHT - 3)
+        self.y -= 2
+
+    def _end_page(self):
+        self.canvas.drawText(self._text_obj)
+        self._text_obj = None
+
+    def _line(self, text, bold=False):
+        self._set_font("Courier-Bold" if bold else "Courier", PDF_FONT_SIZE)
+        self._text_obj.setTextOrigin(PDF_MARGIN, self.y)
+        self._text_obj.textOut(text)
+        self.y -= PDF_ROW_HEIGHT
+
+    def _set_font(self, name, size):
+        if self._font != (name, size):
+            self._text_obj.setFont(name, size)
+            self._font = (name, size)
+
+
+def _format_row(values):
+    cells = []
+    for value, (_, _, width, align) in zip(values, PDF_COLUMNS):
+        text = "" if value is None else str(value)
+        if len(text) > width - 1:
+            text = text[:width - 2] + "…"
+        cells.append(f"{text:{align}{width - 1}} ")
+    return "".join(cells)
+
+def write_pdf(rows, out, month):
+    """
+    Escribe el reporte PDF: una sección por día con sus muestras y un
+    subtotal, y el total del mes al final. rows debe venir ordenado por fecha.
+    """
+    table = PdfTableWriter(
+        out,
+        f"Reporte de Larvas - Mes: {month}",
+        f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+    total = DaySummary(month)
+    day = None
+    for row in rows:
+        date = row.get("date")
+        if day is None or date != day.label:
+            if day is not None:
+                table.subtotal(day)
+            day = DaySummary(date)
+            table.section(f"Fecha: {date}")
+        table.row(row)
+        day.add(row)
+        total.add(row)
+    if day is not None:
+        table.subtotal(day)
+    table.section(
+        f"Total del mes: {total.samples} muestras - {total.colonies} colonias - promedio {total.mean:.1f}"
+    )
+    table.save()
@@ -1,47 +1,64 @@
 import os
+import hmac
 import secrets
+import threading
 from datetime import datetime, timedelta
+from google.cloud.firestore_v1 import transactional
 from utils.firebase_config import get_db
 
-def get_rotating_reset_token():
+ROTATION_INTERVAL = timedelta(days=int(os.getenv("RESET_TOKEN_ROTATION_DAYS", 15)))
+
+# Token vigente en este proceso y hasta cuándo vale (la próxima rotación)
+_cached = None
+_cache_lock = threading.Lock()
+
+@transactional
+def _current_or_rotate(transaction, config_ref, now):
     """
-    Obtiene o genera un token de reseteo que se actualiza cada 15 días.
+    Lee el token y lo rota si venció, dentro de una transacción: si otro
+    proceso ya lo rotó, la transacción se reintenta y devuelve ese token en
+    lugar de generar otro.
     """
-    db = get_db()
-    if not db:
-        return None
-        
-    config_ref = db.collection('system_config').document('reset_token')
-    doc = config_ref.get()
-    
-    now = datetime.now()
-    
+    doc = config_ref.get(transaction=transaction)
     if doc.exists:
         data = doc.to_dict()
         last_update = datetime.fromisoformat(data['last_update'])
-        
-        # Si han pasado más de 15 días, rotar token
-        if now - last_update > timedelta(days=15):
-            new_token = secrets.token_urlsafe(32)
-            config_ref.update({
-                "token": new_token,
-                "last_update": now.isoformat()
-            })
-            return new_token
-        else:
-            return data['token']
-    else:
-        # Inicializar token si no existe
-        initial_token = secrets.token_urlsafe(32)
-        config_ref.set({
-            "token": initial_token,
-            "last_update": now.isoformat()
-        })
-        return initial_token
+        if now - last_update <= ROTATION_INTERVAL:
+            return data['token'], last_update
+
+    token = secrets.token_urlsafe(32)
+    transaction.set(config_ref, {
+        "token": token,
+        "last_update": now.isoformat()
+    })
+    return token, now
+
+def get_rotating_reset_token():
+    """
+    Obtiene o genera un token de reseteo que se actualiza cada 15 días.
+    El token se guarda en memoria hasta su próxima rotación, así que solo
+    se consulta Firestore una vez por proceso y periodo.
+    """
+    global _cached
+    now = datetime.now()
+    with _cache_lock:
+        if _cached is not None and now < _cached[1]:
+            return _cached[0]
+
+        db = get_db()
+        if not db:
+            return None
+
+        config_ref = db.collection('system_config').document('reset_token')
+        token, last_update = _current_or_rotate(db.transaction(), config_ref, now)
+        _cached = (token, last_update + ROTATION_INTERVAL)
+        return token
 
 def verify_reset_token(token):
     """
-    Verifica si el token proporcionado es el actual.
+    Verifica si el token proporcionado es el actual (en tiempo constante).
     """
     current_token = get_rotating_reset_token()
-    return current_token == token
+    if not current_token or not isinstance(token, str):
+        return False
+    return hmac.compare_digest(current_token.encode(), token.encode())
@@ -0,0 +1,63 @@
+from datetime import datetime
+from services.counter_service import IMAGE_FORMATS
+
+
+def upload_job_for(sample_id, user_id, filename, image_bytes, content_type, results, encoding):
+    """
+    Trabajo de subida de una muestra (ver upload_service): el original y las
+    imágenes renderizadas como blobs direccionados por contenido junto a él.
+    """
+    prefix = f"users/{user_id}/samples/{sample_id}"
+    return {
+        "sample_id": sample_id,
+        "prefix": prefix,
+        "original_path": f"{prefix}/original_{filename}",
+        "original_bytes": image_bytes,
+        "original_content_type": content_type,
+        "processed_image_b64": results["processed_image_b64"],
+        "sectors": results["sectors_data"],
+        "content_type": IMAGE_FORMATS[encoding["format"]][1]
+    }
+
+def pending_images(results):
+    """Campos de imagen de una muestra cuya subida todavía no terminó."""
+    return {
+        "original_image_url": None,
+        "processed_image_url": None,
+        "processed_image_size": None,
+        "results.sectors": [{k: v for k, v in s.items() if k != "image_b64"} for s in results["sectors_data"]]
+    }
+
+def build_sample(sample_id, user_id, upload_job, results, images, params, name, crop_type='default',
+                 crop_state='default', notes='', status='completado', **extra):
+    """
+    Documento de 'samples' a partir del resultado del contador y de los campos
+    de imagen devueltos por upload_sample_images (o pending_images).
+    """
+    now = datetime.now()
+    return {
+        "id": sample_id,
+        "user_id": user_id,
+        "name": name,
+        "date": now.strftime('%Y-%m-%d'),
+        "time": now.strftime('%H:%M:%S'),
+        "crop_type": crop_type,
+        "crop_state": crop_state,
+        "original_image_url": images["original_image_url"],
+        "original_image_path": upload_job["original_path"],
+        "processed_image_url": images["processed_image_url"],
+        "processed_image_size": images["processed_image_size"],
+        "results": {
+            "total_colonies": results["total"],
+            "sectors": images["results.sectors"],
+            "stats": results["stats"],
+            "grid": results["grid"]
+        },
+        "params": params,
+        "notes": notes,
+        "status": status,
+        "created_at": now.isoformat(),
+        # Cambia con cada escritura; de él sale el ETag de GET /api/samples/<id>
+        "updated_at": now.isoformat(),
+        **extra
+    }
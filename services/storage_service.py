@@ -0,0 +1,130 @@
+import os
+import base64
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud.firestore_v1 import DELETE_FIELD
+from google.cloud.firestore_v1.field_path import FieldPath
+from utils.firestore_utils import iter_documents
+
+# Extensión de archivo por mimetype de las imágenes renderizadas
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+}
+
+UPLOAD_WORKERS = int(os.getenv("STORAGE_UPLOAD_WORKERS", 8))
+
+# ACL predefinido que se envía en la misma petición de la subida (p.ej. publicRead)
+# en lugar del make_public() posterior; vacío = subir y luego make_public()
+UPLOAD_PREDEFINED_ACL = os.getenv("STORAGE_UPLOAD_PREDEFINED_ACL") or None
+
+def upload_bytes(bucket, path, data, content_type):
+    """Sube un blob público y devuelve su URL."""
+    blob = bucket.blob(path)
+    if UPLOAD_PREDEFINED_ACL:
+        blob.upload_from_string(data, content_type=content_type, predefined_acl=UPLOAD_PREDEFINED_ACL)
+    else:
+        blob.upload_from_string(data, content_type=content_type)
+        blob.make_public()
+    return blob.public_url
+
+def upload_many(bucket, items):
+    """
+    Sube en paralelo una lista de (path, data, content_type) y devuelve las
+    URLs en el mismo orden.
+    """
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_WORKERS, len(items)))) as pool:
+        return list(pool.map(lambda item: upload_bytes(bucket, *item), items))
+
+def content_addressed_path(prefix, data, content_type):
+    """
+    Ruta {prefix}/{sha256}{ext}. Subir el mismo contenido dos veces escribe el
+    mismo blob, por lo que la operación es idempotente.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{prefix}/{digest}{EXTENSIONS.get(content_type, '')}"
+
+def sample_image_blobs(prefix, processed_image_b64, sectors, content_type="image/png"):
+    """Blobs (path, data, content_type) de la imagen general y los recortes en Base64."""
+    encoded = []
+    if processed_image_b64:
+        encoded.append(processed_image_b64)
+    encoded.extend(s["image_b64"] for s in sectors if s.get("image_b64"))
+    blobs = []
+    for b64 in encoded:
+        data = base64.b64decode(b64)
+        blobs.append((content_addressed_path(prefix, data, content_type), data, content_type))
+    return blobs
+
+def with_image_urls(processed_image_b64, sectors, blobs, urls):
+    """
+    Asocia las URLs de sample_image_blobs a la muestra. Devuelve
+    (processed_image, sectors) como store_sample_images.
+    """
+    stored = iter({"url": url, "size": len(blob[1])} for blob, url in zip(blobs, urls))
+    processed_image = next(stored) if processed_image_b64 else None
+    new_sectors = []
+    for s in sectors:
+        sector = {k: v for k, v in s.items() if k != "image_b64"}
+        if s.get("image_b64"):
+            blob = next(stored)
+            sector["image_url"] = blob["url"]
+            sector["image_size"] = blob["size"]
+        new_sectors.append(sector)
+    return processed_image, new_sectors
+
+def store_sample_images(bucket, prefix, processed_image_b64, sectors, content_type="image/png"):
+    """
+    Sube la imagen general y los recortes por sector (en Base64) a Storage.
+    Devuelve (processed_image, sectors) donde processed_image es {"url", "size"}
+    o None y cada sector reemplaza image_b64 por image_url e image_size.
+    """
+    blobs = sample_image_blobs(prefix, processed_image_b64, sectors, content_type)
+    return with_image_urls(processed_image_b64, sectors, blobs, upload_many(bucket, blobs))
+
+def migrate_sample_images(db, bucket, page_size=100, dry_run=False):
+    """
+    Mueve processed_image_b64 y results.sectors[*].image_b64 de los documentos
+    existentes en 'samples' a Storage. Los documentos ya migrados se omiten,
+    así que el proceso puede relanzarse si se interrumpe.
+    """
+
+    stats = {"scanned": 0, "migrated": 0, "bytes_moved": 0, "errors": 0}
+    query = db.collection('samples').order_by(FieldPath.document_id())
+
+    for doc in iter_documents(query, page_size=page_size):
+        stats["scanned"] += 1
+        data = doc.to_dict()
+        results = data.get("results") or {}
+        sectors = results.get("sectors") or []
+        processed_b64 = data.get("processed_image_b64")
+        if not processed_b64 and not any(s.get("image_b64") for s in sectors):
+            continue
+
+        try:
+            moved = len(processed_b64 or "") + sum(len(s.get("image_b64") or "") for s in sectors)
+            if not dry_run:
+                processed_image, new_sectors = store_sample_images(
+                    bucket,
+                    f"users/{data.get('user_id')}/samples/{doc.id}",
+                    processed_b64,
+                    sectors
+                )
+                doc.reference.update({
+                    "processed_image_b64": DELETE_FIELD,
+                    "processed_image_url": processed_image["url"] if processed_image else None,
+                    "processed_image_size": processed_image["size"] if processed_image else None,
+                    "results.sectors": new_sectors,
+                    "updated_at": datetime.now().isoformat()
+                })
+            stats["migrated"] += 1
+            stats["bytes_moved"] += moved
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"Error migrating sample {doc.id}: {e}")
+
+    return stats
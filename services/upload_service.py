@@ -0,0 +1,264 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from google.cloud.firestore_v1.field_path import FieldPath
+from services.storage_service import upload_many, sample_image_blobs, with_image_urls
+from utils.firebase_config import get_db, get_bucket
+from utils.firestore_utils import iter_documents
+
+
+class BackgroundUploader:
+    """
+    Subida diferida (write-behind) de las imágenes de una muestra.
+
+    El request guarda el documento con status 'subiendo' y encola la subida;
+    un número fijo de hilos (el límite de concurrencia) sube el original y las
+    imágenes renderizadas y actualiza el documento a 'completado'. Cada subida
+    se reintenta con espera exponencial; si se agotan los intentos el documento
+    queda en 'error' con upload_error.
+
+    La cola está acotada en trabajos (max_queue) y en bytes de imágenes
+    retenidas en memoria (max_bytes): submit() devuelve False cuando se
+    superaría alguno de los dos y quien llama debe subir de forma síncrona.
+    Un trabajo más grande que max_bytes solo se acepta con la cola vacía.
+
+    Si el proceso muere con trabajos pendientes sus muestras quedan en
+    'subiendo'; recover_stale_uploads (comando recover-stale-uploads) las pasa
+    a 'error'.
+    """
+
+    def __init__(self, workers=4, max_queue=64, max_bytes=256 * 1024 * 1024, retries=3, backoff=1.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._rejected = 0
+        self._queued_bytes = 0
+        self._durations = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv("SAMPLE_UPLOAD_WORKERS", 4)),
+            max_queue=int(os.getenv("SAMPLE_UPLOAD_QUEUE_SIZE", 64)),
+            max_bytes=int(os.getenv("SAMPLE_UPLOAD_QUEUE_BYTES", 256 * 1024 * 1024)),
+            retries=int(os.getenv("SAMPLE_UPLOAD_RETRIES", 3)),
+            backoff=float(os.getenv("SAMPLE_UPLOAD_RETRY_BACKOFF", 1.0))
+        )
+
+    def submit(self, job):
+        """
+        Encola un trabajo de subida. job es un dict con sample_id, prefix,
+        original_path, original_bytes, original_content_type,
+        processed_image_b64, sectors y content_type.
+        """
+        size = job_bytes(job)
+        q = self._get_queue()
+        with self._lock:
+            if self._queued_bytes and self._queued_bytes + size > self.max_bytes:
+                self._rejected += 1
+                return False
+            try:
+                q.put_nowait((time.monotonic(), size, job))
+            except queue.Full:
+                self._rejected += 1
+                return False
+            self._queued_bytes += size
+            self._submitted += 1
+        return True
+
+    def join(self, timeout=None):
+        """Espera a que se vacíe la cola (o hasta timeout segundos). Devuelve True si terminó."""
+        q = self._queue
+        if q is None or self._pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while q.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        with self._lock:
+            durations = sorted(self._durations)
+            q = self._queue if self._pid == os.getpid() else None
+            return {
+                "workers": self.workers,
+                "queue_size": self.max_queue,
+                "queue_depth": q.qsize() if q else 0,
+                "queue_bytes_limit": self.max_bytes,
+                "queued_bytes": self._queued_bytes if q else 0,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "retried": self._retried,
+                "rejected": self._rejected,
+                "duration_ms": {
+                    "p50": round(1000 * durations[len(durations) // 2], 2) if durations else 0.0,
+                    "p95": round(1000 * durations[int(len(durations) * 0.95)], 2) if durations else 0.0
+                }
+            }
+
+    def _get_queue(self):
+        with self._lock:
+            # Los hilos no sobreviven a un fork: la cola y los hilos son por proceso
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._queued_bytes = 0
+                self._pid = os.getpid()
+                for i in range(self.workers):
+                    threading.Thread(
+                        target=self._run, args=(self._queue,),
+                        name=f"sample-uploader-{i}", daemon=True
+                    ).start()
+            return self._queue
+
+    def _run(self, q):
+        while True:
+            submitted_at, size, job = q.get()
+            try:
+                self._upload(job)
+                with self._lock:
+                    self._completed += 1
+                    self._durations.append(time.monotonic() - submitted_at)
+            except Exception as e:
+                with self._lock:
+                    self._failed += 1
+                print(f"Error uploading images for sample {job['sample_id']}: {e}")
+                self._mark_failed(job, e)
+            finally:
+                with self._lock:
+                    self._queued_bytes -= size
+                q.task_done()
+
+    def _upload(self, job):
+        bucket = get_bucket()
+        db = get_db()
+        if not bucket or not db:
+            raise RuntimeError("Firebase not available")
+
+        # Las subidas son idempotentes (mismas rutas), así que reintentar es seguro
+        fields = self._with_retries(upload_sample_images, bucket, job)
+        self._with_retries(db.collection('samples').document(job["sample_id"]).update, {
+            **fields, "status": "completado", "updated_at": datetime.now().isoformat()
+        })
+
+    def _with_retries(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                with self._lock:
+                    self._retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _mark_failed(self, job, error):
+        try:
+            get_db().collection('samples').document(job["sample_id"]).update({
+                "status": "error",
+                "upload_error": str(error),
+                "updated_at": datetime.now().isoformat()
+            })
+        except Exception as e:
+            print(f"Error marking sample {job['sample_id']} as failed: {e}")
+
+
+def job_bytes(job):
+    """Bytes de imagen que un trabajo de subida retiene en memoria mientras espera."""
+    return (
+        len(job["original_bytes"])
+        + len(job["processed_image_b64"] or "")
+        + sum(len(s.get("image_b64") or "") for s in job["sectors"])
+    )
+
+def recover_stale_uploads(db, stale_after=3600, page_size=200, dry_run=False):
+    """
+    Pasa a 'error' las muestras que siguen en 'subiendo' más de stale_after
+    segundos después de su última actualización: su trabajo de subida se
+    perdió con el proceso que lo tenía en cola. La escritura exige que el
+    documento no haya cambiado desde la lectura, así que no pisa una subida
+    que termine mientras tanto.
+    """
+    stats = {"scanned": 0, "recovered": 0, "errors": 0}
+    cutoff = (datetime.now() - timedelta(seconds=stale_after)).isoformat()
+    query = db.collection('samples').where('status', '==', 'subiendo').order_by(FieldPath.document_id())
+
+    for doc in iter_documents(query, page_size=page_size):
+        stats["scanned"] += 1
+        data = doc.to_dict()
+        if (data.get("updated_at") or data.get("created_at") or "") >= cutoff:
+            continue
+        try:
+            if not dry_run:
+                doc.reference.update({
+                    "status": "error",
+                    "upload_error": "Upload interrupted: the server stopped before finishing it",
+                    "updated_at": datetime.now().isoformat()
+                }, option=db.write_option(last_update_time=doc.update_time))
+            stats["recovered"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"Error recovering sample {doc.id}: {e}")
+
+    return stats
+
+def upload_sample_images(bucket, job):
+    """
+    Sube el original y las imágenes renderizadas de un trabajo y devuelve los
+    campos a actualizar en el documento de la muestra.
+    """
+    return upload_samples_images(bucket, [job])[0]
+
+def upload_samples_images(bucket, jobs):
+    """
+    Como upload_sample_images para varios trabajos: todos sus blobs se suben
+    en una sola pasada paralela. Devuelve los campos de cada trabajo en orden.
+    """
+    items, layout = [], []
+    for job in jobs:
+        blobs = sample_image_blobs(job["prefix"], job["processed_image_b64"], job["sectors"], job["content_type"])
+        layout.append((len(items), blobs))
+        items.append((job["original_path"], job["original_bytes"], job["original_content_type"]))
+        items.extend(blobs)
+    urls = upload_many(bucket, items)
+
+    fields = []
+    for job, (offset, blobs) in zip(jobs, layout):
+        processed_image, sectors = with_image_urls(
+            job["processed_image_b64"], job["sectors"], blobs, urls[offset + 1:offset + 1 + len(blobs)]
+        )
+        fields.append({
+            "original_image_url": urls[offset],
+            "processed_image_url": processed_image["url"] if processed_image else None,
+            "processed_image_size": processed_image["size"] if processed_image else None,
+            "results.sectors": sectors
+        })
+    return fields
+
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def get_uploader():
+    """Uploader compartido por el proceso, creado en el primer uso."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = BackgroundUploader.from_env()
+            atexit.register(_uploader.join, float(os.getenv("SAMPLE_UPLOAD_DRAIN_TIMEOUT", 30)))
+        return _uploader
@@ -0,0 +1,133 @@
+"""
+Agregados mensuales escritos por SampleWriter con Increment y set(merge=True),
+sobre un Firestore en memoria que aplica la semántica de merge: los valores
+hoja (incluido un mapa vacío) reemplazan al guardado y los Increment suman.
+"""
+from google.cloud.firestore_v1 import Increment
+
+from services.aggregate_service import aggregate_ref, empty_aggregate, apply_sample, summarize
+from services.batch_writer import SampleWriter
+
+MONTH = "2026-10"
+
+
+def merge(stored, fields):
+    for key, value in fields.items():
+        if isinstance(value, Increment):
+            stored[key] = stored.get(key, 0) + value.value
+        elif isinstance(value, dict) and value:
+            stored[key] = merge(dict(stored.get(key) or {}), value)
+        else:
+            stored[key] = value
+    return stored
+
+
+class Snapshot:
+    def __init__(self, ref, data):
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Ref:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+
+class Collection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id):
+        return Ref(self.db, f"{self.name}/{doc_id}")
+
+
+class Batch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref, data, merge))
+
+    def commit(self):
+        for ref, data, merged in self.writes:
+            if merged:
+                self.db.docs[ref.path] = merge(self.db.docs.get(ref.path, {}), data)
+            else:
+                self.db.docs[ref.path] = dict(data)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        return Collection(self, name)
+
+    def batch(self):
+        return Batch(self)
+
+    def get_all(self, refs):
+        return [Snapshot(ref, self.docs.get(ref.path)) for ref in refs]
+
+
+def make_sample(index, total, crop="maiz"):
+    return {
+        "id": f"s{index}",
+        "user_id": "u1",
+        "date": f"{MONTH}-05",
+        "crop_type": crop,
+        "results": {"total_colonies": total}
+    }
+
+
+def seed(db, samples):
+    aggregate = empty_aggregate("u1", MONTH)
+    for sample in samples:
+        db.docs[f"samples/{sample['id']}"] = sample
+        apply_sample(aggregate, sample)
+    db.docs[aggregate_ref(db, "u1", MONTH).path] = aggregate
+
+
+def month_summary(db):
+    return summarize(db.docs[aggregate_ref(db, "u1", MONTH).path], MONTH)
+
+
+def test_net_zero_replace_keeps_histogram_and_crops():
+    db = FakeFirestore()
+    samples = [make_sample(0, 12), make_sample(1, 40), make_sample(2, 7, crop="trigo")]
+    seed(db, samples)
+    before = month_summary(db)
+
+    # Reanudación de un trabajo: las mismas filas se reprocesan con los mismos totales
+    writer = SampleWriter(db)
+    for sample in samples:
+        writer.add(db.collection("samples").document(sample["id"]), dict(sample), replace=True)
+    writer.flush()
+
+    after = month_summary(db)
+    assert after["max"] == 40 and after["min"] == 7
+    assert {k: v for k, v in after.items() if k != "updated_at"} == \
+        {k: v for k, v in before.items() if k != "updated_at"}
+
+
+def test_replace_with_new_total_moves_histogram_entry():
+    db = FakeFirestore()
+    samples = [make_sample(0, 12), make_sample(1, 40)]
+    seed(db, samples)
+
+    writer = SampleWriter(db)
+    writer.add(db.collection("samples").document("s1"), make_sample(1, 55), replace=True)
+    writer.flush()
+
+    summary = month_summary(db)
+    assert summary["count"] == 2
+    assert summary["total_colonies"] == 67
+    assert (summary["max"], summary["min"]) == (55, 12)
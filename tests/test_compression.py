@@ -0,0 +1,61 @@
+"""
+Respuestas en streaming (exportaciones, eventos de process-batch) codificadas
+con FastJSONProvider y comprimidas por bloques, y la forma del ETag en los 304.
+"""
+import gzip
+import json
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+from middlewares.compression import init_compression
+from middlewares.json_provider import FastJSONProvider
+from middlewares.req_res import success
+from services.export_service import iter_ndjson, iter_json
+
+ROWS = [{"id": f"s{i}", "name": "Muestra ñ", "results": {"total_colonies": i}} for i in range(300)]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    init_compression(app)
+
+    @app.get("/ndjson")
+    def ndjson():
+        return Response(stream_with_context(iter_ndjson(iter(ROWS))), mimetype="application/x-ndjson")
+
+    @app.get("/json")
+    def json_export():
+        return Response(stream_with_context(iter_json(iter(ROWS))), mimetype="application/json")
+
+    @app.get("/cached")
+    def cached():
+        return success(ROWS, etag='"abc"')
+
+    return app.test_client()
+
+
+def test_ndjson_stream_is_gzipped(client):
+    response = client.get("/ndjson", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+    assert len(response.data) < len(b"\n".join(line.encode() for line in lines)) / 3
+
+
+def test_json_stream_matches_success_envelope(client):
+    # Cada stream se consume antes del siguiente request (el contexto sigue abierto hasta entonces)
+    compressed = client.get("/json", headers={"Accept-Encoding": "gzip"}).data
+    plain = client.get("/json", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzip.decompress(compressed) == plain.data
+    assert json.loads(plain.data) == {"status": "success", "data": ROWS}
+
+
+def test_not_modified_echoes_the_etag_form_sent(client):
+    etag = client.get("/cached", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    assert etag == 'W/"abc"'
+    assert client.get("/cached", headers={"If-None-Match": etag}).headers["ETag"] == 'W/"abc"'
+    assert client.get("/cached", headers={"If-None-Match": '"abc"'}).headers["ETag"] == '"abc"'
@@ -0,0 +1,63 @@
+"""
+Paridad de la detección por componentes conexas (CounterPipeline.detect) con
+la implementación anterior por contornos (benchmarks/parity_contours.py).
+"""
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import make_plate
+from benchmarks.parity_contours import detect_contours, SIZES, DENSITIES, SENSITIVITIES, SECTORS
+from services.counter_service import get_pipeline, process_sample_image, _grid_shape, _bin_points
+
+# Diferencia relativa admitida (mínimo 1 colonia), como en el script
+TOLERANCE = 0.01
+
+
+@pytest.fixture(scope="module", params=[(w, h, n) for w, h in SIZES for n in DENSITIES],
+                ids=lambda p: f"{p[0]}x{p[1]}-n{p[2]}")
+def prepared(request):
+    width, height, colonies = request.param
+    image_bytes, _ = make_plate(width, height, colonies, seed=colonies)
+    img, blurred = get_pipeline().prepare(image_bytes)
+    return image_bytes, img.shape[:2], blurred
+
+
+@pytest.mark.parametrize("sensitivity", SENSITIVITIES)
+def test_components_match_contours(prepared, sensitivity):
+    _, (h, w), blurred = prepared
+    pipeline = get_pipeline()
+    legacy = detect_contours(pipeline, blurred, sensitivity)
+    current = pipeline.detect(blurred, sensitivity)
+    allowed = max(1, int(round(TOLERANCE * len(legacy))))
+
+    assert abs(len(legacy) - len(current)) <= allowed
+    for sectors in SECTORS:
+        rows, cols = _grid_shape(sectors)
+        a = _bin_points(legacy, rows, cols, h, w)[:sectors]
+        b = _bin_points(current, rows, cols, h, w)[:sectors]
+        assert int(np.max(np.abs(a - b))) <= allowed, f"sectors={sectors}"
+
+
+def test_area_bounds_per_call_share_pipeline(prepared):
+    image_bytes, _, blurred = prepared
+    pipeline = get_pipeline()
+    default = pipeline.detect(blurred, 50)
+
+    # Un max_area por debajo del tamaño de las colonias las descarta todas
+    assert pipeline.detect(blurred, 50, max_area=3) == []
+    assert pipeline.detect(blurred, 50, min_area=pipeline.min_area, max_area=pipeline.max_area) == default
+    result = process_sample_image(image_bytes, render="counts", min_area=0, max_area=3)
+    assert result["total"] == 0
+    # Los límites del request no crean otra instancia ni cambian los de la compartida
+    assert get_pipeline() is pipeline
+    assert pipeline.detect(blurred, 50) == default
+
+
+def test_tiled_area_bounds_match_untiled():
+    # Ambos límites filtran: sin escalar min_area el modo por mosaicos conservaría casi todas
+    image_bytes, _ = make_plate(3200, 2400, 300, seed=7)
+    untiled = process_sample_image(image_bytes, render="counts", min_area=40, max_area=90)["total"]
+    tiled = process_sample_image(image_bytes, render="counts", tiled=True, min_area=40, max_area=90)["total"]
+
+    assert 0 < untiled < 250
+    assert abs(tiled - untiled) <= 0.1 * untiled
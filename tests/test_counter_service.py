@@ -0,0 +1,76 @@
+"""
+Regresión del conteo por sectores: el binning vectorizado (_bin_points) debe
+dar los mismos conteos y estadísticas que el bucle por sector original.
+"""
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import make_plate
+from services.counter_service import process_sample_image, _bin_points, _grid_shape
+
+# Tamaños no divisibles por la grilla para ejercitar el residuo de la última fila/columna
+PLATES = [(800, 600, 120, 1), (803, 611, 300, 2), (1600, 1213, 500, 3)]
+
+
+def legacy_sector_counts(points, sectors, h, w):
+    """Conteo por sector tal como lo hacía process_sample_image antes de vectorizarlo."""
+    cols = int(np.sqrt(sectors))
+    if cols * cols < sectors:
+        cols += 1
+    rows = (sectors + cols - 1) // cols
+
+    counts = []
+    qh, qw = h // rows, w // cols
+    for r in range(rows):
+        for c in range(cols):
+            idx = r * cols + c
+            if idx >= sectors:
+                break
+            x_start = c * qw
+            y_start = r * qh
+            x_end = (c + 1) * qw if c < cols - 1 else w
+            y_end = (r + 1) * qh if r < rows - 1 else h
+            counts.append(sum(1 for p in points if x_start <= p[0] < x_end and y_start <= p[1] < y_end))
+    return counts
+
+
+def legacy_stats(counts):
+    return {
+        "mean": float(np.mean(counts)) if counts else 0.0,
+        "max": int(np.max(counts)) if counts else 0,
+        "min": int(np.min(counts)) if counts else 0
+    }
+
+
+@pytest.fixture(scope="module", params=PLATES, ids=lambda p: f"{p[0]}x{p[1]}-n{p[2]}")
+def plate(request):
+    width, height, colonies, seed = request.param
+    image_bytes, _ = make_plate(width, height, colonies, seed=seed)
+    return image_bytes
+
+
+@pytest.mark.parametrize("sectors", range(1, 37))
+def test_sector_counts_match_legacy_loop(plate, sectors):
+    result = process_sample_image(plate, sectors=sectors, render="counts")
+    h, w = result["resolution"]["height"], result["resolution"]["width"]
+    expected = legacy_sector_counts(result["points"], sectors, h, w)
+
+    assert [s["count"] for s in result["sectors_data"]] == expected
+    assert [s["sector"] for s in result["sectors_data"]] == list(range(1, sectors + 1))
+    assert result["stats"] == legacy_stats(expected)
+    assert result["total"] == len(result["points"])
+
+
+@pytest.mark.parametrize("sectors", [1, 2, 3, 5, 7, 10, 16, 36])
+def test_bin_points_on_every_pixel(sectors):
+    # Un punto en cada píxel: cubre todos los bordes entre sectores
+    h, w = 37, 53
+    points = [(x, y) for y in range(h) for x in range(w)]
+    rows, cols = _grid_shape(sectors)
+    counts = _bin_points(points, rows, cols, h, w)[:sectors]
+    assert counts.tolist() == legacy_sector_counts(points, sectors, h, w)
+
+
+def test_bin_points_without_points():
+    rows, cols = _grid_shape(9)
+    assert _bin_points([], rows, cols, 600, 800).tolist() == [0] * 9
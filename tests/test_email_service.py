@@ -0,0 +1,157 @@
+"""
+Outbox contra un servidor SMTP en el mismo proceso (socketserver): envío por
+conexiones persistentes, reintento de respuestas 4xx sin frenar al resto del
+lote y descarte de los errores permanentes.
+"""
+import time
+import threading
+import socketserver
+from email import message_from_bytes
+
+import pytest
+
+from services.email_service import Outbox, build_message
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Lo mínimo de SMTP que usa smtplib.send_message, sin STARTTLS ni AUTH."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost SMTP stub")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip().strip("<>")
+                if recipient in self.server.rejected:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(recipient)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b""
+                while not data.endswith(b"\r\n.\r\n"):
+                    data += self.rfile.readline()
+                self.reply(self.server.accept(recipients, data[:-5]))
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.received = []
+        self.rejected = set()
+        # Destinatario -> cantidad de respuestas 451 antes de aceptar el mensaje
+        self.deferrals = {}
+
+    def accept(self, recipients, data):
+        with self.lock:
+            for recipient in recipients:
+                if self.deferrals.get(recipient):
+                    self.deferrals[recipient] -= 1
+                    return "451 Try again later"
+            message = message_from_bytes(data)
+            self.received.append((message["To"], time.monotonic()))
+            return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_outbox(server, **kwargs):
+    host, port = server.server_address
+    options = {"starttls": False, "senders": 1, "batch_size": 20, "backoff": 0.3, "idle_timeout": 5, "timeout": 5}
+    options.update(kwargs)
+    return Outbox(host, port, "no-reply@example.com", **options)
+
+
+def message_to(address):
+    return build_message(address, "Prueba", "<p>Hola</p>")
+
+
+def test_sends_over_one_persistent_connection(smtp_server):
+    outbox = make_outbox(smtp_server)
+    for i in range(5):
+        assert outbox.send(message_to(f"user{i}@example.com"))
+
+    assert outbox.join(timeout=10)
+    assert sorted(to for to, _ in smtp_server.received) == [f"user{i}@example.com" for i in range(5)]
+    stats = outbox.stats()
+    assert stats["sent"] == 5
+    assert stats["connections"] == 1
+    assert smtp_server.connections == 1
+
+
+def test_temporary_failure_is_retried_without_blocking_the_batch(smtp_server):
+    smtp_server.deferrals["slow@example.com"] = 2
+    outbox = make_outbox(smtp_server)
+    start = time.monotonic()
+    outbox.send(message_to("slow@example.com"))
+    outbox.send(message_to("fast@example.com"))
+
+    assert outbox.join(timeout=10)
+    arrivals = dict(smtp_server.received)
+    # Los reintentos (0.3 s y 0.6 s) no demoran al mensaje siguiente
+    assert arrivals["fast@example.com"] - start < 0.3
+    assert arrivals["slow@example.com"] - start >= 0.9
+    stats = outbox.stats()
+    assert stats["sent"] == 2
+    assert stats["retried"] == 2
+    assert stats["failed"] == 0
+    assert stats["delayed"] == 0
+
+
+def test_retries_are_bounded(smtp_server):
+    smtp_server.deferrals["down@example.com"] = 10
+    outbox = make_outbox(smtp_server, retries=2, backoff=0.05)
+    outbox.send(message_to("down@example.com"))
+
+    assert outbox.join(timeout=10)
+    stats = outbox.stats()
+    assert stats["retried"] == 2
+    assert stats["failed"] == 1
+    assert smtp_server.received == []
+
+
+def test_permanent_failure_is_not_retried(smtp_server):
+    smtp_server.rejected.add("nobody@example.com")
+    outbox = make_outbox(smtp_server)
+    outbox.send(message_to("nobody@example.com"))
+    outbox.send(message_to("user@example.com"))
+
+    assert outbox.join(timeout=10)
+    stats = outbox.stats()
+    assert stats["failed"] == 1
+    assert stats["retried"] == 0
+    assert [to for to, _ in smtp_server.received] == ["user@example.com"]
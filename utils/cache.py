@@ -0,0 +1,96 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Caché LRU en memoria, segura entre hilos, acotada por número de
+    entradas y opcionalmente por tamaño total en bytes.
+
+    Las entradas pueden vencer: con ttl (segundos) en el constructor o con un
+    expires_at (timestamp Unix) por entrada en set(). Una entrada vencida se
+    trata como ausente.
+    """
+
+    def __init__(self, maxsize=128, max_bytes=None, sizeof=None, ttl=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            expires_at = self._expires.get(key)
+            if expires_at is not None and expires_at <= time.time():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key, value, expires_at=None):
+        size = self._sizeof(value)
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Un valor más grande que la caché completa no se guarda
+                self._pop(key)
+                return
+            self._pop(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            if expires_at is not None:
+                self._expires[key] = expires_at
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._bytes -= self._sizes.pop(key)
+        self._expires.pop(key, None)
+        return self._data.pop(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -1,18 +1,98 @@
 import os
+import time
+import threading
 import firebase_admin
 from firebase_admin import credentials, firestore, storage, auth
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def initialize_firebase():
+
+class FirebaseRegistry:
     """
-    Inicializa Firebase Admin SDK usando una ruta a las credenciales en .env
-    o buscando el archivo por defecto (ADC).
+    Registro de clientes de Firebase del proceso.
+
+    La app de Firebase Admin se inicializa una sola vez y cada cliente
+    (Firestore, Storage, Auth) se crea en el primer uso y se reutiliza. Si la
+    inicialización falla, el error se recuerda durante retry_interval segundos
+    para no reintentar ni imprimir el error en cada request.
+
+    Es seguro con gunicorn preload_app: tras un fork el hijo borra la app
+    heredada con firebase_admin.delete_app (junto con los clientes que guarda)
+    y la vuelve a inicializar en el primer uso, con sus propios canales gRPC/HTTP.
     """
-    if not firebase_admin._apps:
+
+    def __init__(self, retry_interval=30):
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._failed = {}
+        self._pid = os.getpid()
+
+    def initialize(self):
+        """Inicializa la app de Firebase Admin si aún no existe. Devuelve True si está disponible."""
+        if firebase_admin._apps:
+            return True
+        with self._lock:
+            return self._initialize_app()
+
+    def get(self, name):
+        """Devuelve el cliente 'db', 'bucket' o 'auth', o None si no está disponible."""
+        client = self._clients.get(name)
+        if client is not None and self._pid == os.getpid():
+            return client
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if name in self._clients:
+                return self._clients[name]
+            failed_at = self._failed.get(name)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+                return None
+            if not self._initialize_app():
+                self._failed[name] = time.monotonic()
+                return None
+            try:
+                client = _FACTORIES[name]()
+            except Exception as e:
+                self._failed[name] = time.monotonic()
+                print(f"\033[93mWARNING: Firebase service '{name}' could not be accessed.\033[0m")
+                print(f"Error accessing services: {e}")
+                return None
+            self._failed.pop(name, None)
+            self._clients[name] = client
+            return client
+
+    def reset(self):
+        """Descarta los clientes creados; se recrean en el próximo uso."""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._clients = {}
+        self._failed = {}
+        self._pid = os.getpid()
+
+    def _after_fork(self):
+        # Se ejecuta en el hijo: el lock del registro pudo quedar tomado por un hilo del padre
+        self._lock = threading.Lock()
+        self._reset()
+        # firebase_admin guarda los servicios (y sus canales) dentro de la App:
+        # se borra la heredada para que _initialize_app cree una nueva en el hijo
+        try:
+            firebase_admin.delete_app(firebase_admin.get_app())
+        except ValueError:
+            pass
+
+    def _initialize_app(self):
+        if firebase_admin._apps:
+            return True
+        failed_at = self._failed.get("app")
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+            return False
+
         cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
-        
         try:
             if cred_path and os.path.exists(cred_path):
                 cred = credentials.Certificate(cred_path)
@@ -26,31 +106,44 @@ def initialize_firebase():
                     'storageBucket': os.getenv("FIREBASE_STORAGE_BUCKET")
                 })
         except Exception as e:
+            self._failed["app"] = time.monotonic()
             print(f"\033[91mCRITICAL ERROR: Firebase could not be initialized.\033[0m")
             print(f"Details: {e}")
             print(f"Please check your FIREBASE_SERVICE_ACCOUNT_JSON path in .env")
-            return None
-                
-    try:
-        return {
-            "db": firestore.client(),
-            "bucket": storage.bucket(),
-            "auth": auth
-        }
-    except Exception as e:
-        print(f"\033[93mWARNING: Firebase services could not be accessed.\033[0m")
-        print(f"Error accessing services: {e}")
+            return False
+        self._failed.pop("app", None)
+        return True
+
+
+_FACTORIES = {
+    "db": firestore.client,
+    "bucket": storage.bucket,
+    "auth": lambda: auth
+}
+
+registry = FirebaseRegistry(retry_interval=float(os.getenv("FIREBASE_RETRY_INTERVAL", 30)))
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry._after_fork)
+
+def initialize_firebase():
+    """
+    Inicializa Firebase Admin SDK usando una ruta a las credenciales en .env
+    o buscando el archivo por defecto (ADC).
+    """
+    if not registry.initialize():
         return None
+    return {
+        "db": get_db(),
+        "bucket": get_bucket(),
+        "auth": get_auth()
+    }
 
 # Helper functions to get clients safely
 def get_db():
-    resources = initialize_firebase()
-    return resources["db"] if resources else None
+    return registry.get("db")
 
 def get_bucket():
-    resources = initialize_firebase()
-    return resources["bucket"] if resources else None
+    return registry.get("bucket")
 
 def get_auth():
-    resources = initialize_firebase()
-    return resources["auth"] if resources else None
+    return registry.get("auth")
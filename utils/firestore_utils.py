@@ -0,0 +1,40 @@
+def iter_documents(query, page_size=200):
+    """
+    Recorre una consulta de Firestore en páginas usando cursores,
+    sin mantener más de una página en memoria.
+    La consulta debe tener un order_by para que el cursor sea estable.
+    """
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+def fetch_page(collection, query, limit, cursor=None, fields=None, owner=None):
+    """
+    Lee una página de una consulta ordenada. cursor es el id del último
+    documento de la página anterior; si se indica owner, el documento del
+    cursor debe pertenecerle (campo user_id). fields proyecta los campos con
+    select() (el id del documento siempre se incluye).
+
+    Devuelve (items, next_cursor); next_cursor es None en la última página.
+    Lanza ValueError si el cursor no es válido.
+    """
+    if cursor:
+        snapshot = collection.document(cursor).get()
+        if not snapshot.exists or (owner is not None and (snapshot.to_dict() or {}).get('user_id') != owner):
+            raise ValueError("Invalid cursor")
+        query = query.start_after(snapshot)
+    if fields:
+        query = query.select(list(dict.fromkeys(['id', *fields])))
+
+    # Un documento extra indica si hay otra página sin una consulta adicional
+    docs = list(query.limit(limit + 1).stream())
+    items = [{**doc.to_dict(), 'id': doc.id} for doc in docs[:limit]]
+    next_cursor = docs[limit - 1].id if len(docs) > limit else None
+    return items, next_cursor